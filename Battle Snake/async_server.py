@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import typing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import tracing
+from sessions import MAX_GAMES
+
+# Production server: an asyncio HTTP front end that only parses requests and
+# hands every handler call to a process pool, so one game's search never
+# holds up another game's /move.
+#
+# With affinity on, there is one single-process pool per worker and every
+# game is pinned to the worker with the fewest live games when it is first
+# seen, so anything a handler keeps in memory between turns stays in the
+# process that serves that game. Games only share a worker once there are
+# more games than workers. With affinity off, all requests share one pool.
+# Like the session stores, the pinning is capped: past MAX_GAMES games per
+# worker, the least recently seen game is dropped and frees its slot, so
+# games whose /end never arrives do not skew placement forever.
+#
+# Requests are traced like in server.py: parsing and serialization are timed
+# here and the handler's own trace comes back from the worker with its
+# result. METRICS=1 adds GET /metrics.
+#
+#   SERVER=async WORKERS=4 python main.py
+
+_handlers = None
+
+
+def _init_worker(handlers):
+    global _handlers
+    _handlers = handlers
+
+
+def _call(name, game_state):
+    trace = tracing.begin(name)
+    with trace.phase("handler"):
+        result = _handlers[name](game_state)
+    record = tracing.end()
+    del record["timings_ms"]["total"]  # the front end times the whole request
+    return result, record
+
+
+class _Workers:
+    def __init__(self, handlers, workers, affinity):
+        self.affinity = affinity
+        if affinity:
+            self.pools = [
+                ProcessPoolExecutor(1, initializer=_init_worker, initargs=(handlers,))
+                for _ in range(workers)
+            ]
+        else:
+            self.pools = [ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(handlers,))]
+        self.games = OrderedDict()  # game id -> pool index, least recently seen first
+        self.load = [0] * len(self.pools)
+        self.max_games = MAX_GAMES * len(self.pools)
+
+    def pool_for(self, game_id):
+        if not self.affinity:
+            return self.pools[0]
+        index = self.games.get(game_id)
+        if index is None:
+            index = min(range(len(self.pools)), key=self.load.__getitem__)
+            self.games[game_id] = index
+            self.load[index] += 1
+            while len(self.games) > self.max_games:
+                _, dropped = self.games.popitem(last=False)
+                self.load[dropped] -= 1
+        else:
+            self.games.move_to_end(game_id)
+        return self.pools[index]
+
+    def release(self, game_id):
+        index = self.games.pop(game_id, None)
+        if index is not None:
+            self.load[index] -= 1
+
+    async def call(self, name, game_state):
+        game_id = game_state.get("game", {}).get("id")
+        pool = self.pool_for(game_id)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, _call, name, game_state)
+        finally:
+            if name == "end":
+                self.release(game_id)
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def _response(status, body, keep_alive):
+    head = (
+        f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "server: battlesnake/replit/starter-snake-python\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def _handle(handlers, workers, method, path, body):
+    # returns (status, result, trace or None)
+    if method == "GET" and path == "/":
+        return 200, handlers["info"](), None
+    if method == "GET" and path == "/metrics" and os.environ.get("METRICS"):
+        return 200, tracing.METRICS.snapshot(), None
+    if method != "POST" or path not in ("/start", "/move", "/end"):
+        return 404, {"error": "not found"}, None
+    name = path[1:]
+    trace = tracing.Trace(name)
+    try:
+        with trace.phase("parse"):
+            game_state = json.loads(body)
+    except ValueError:
+        return 400, {"error": "invalid json"}, None
+    trace.set(game=game_state["game"]["id"], turn=game_state.get("turn"))
+    result, record = await workers.call(name, game_state)
+    trace.merge(record)
+    if name == "move":
+        return 200, result, trace
+    return 200, "ok", trace
+
+
+def run_async_server(handlers: typing.Dict, workers: int = None, affinity: bool = True):
+    workers = workers or int(os.environ.get("WORKERS", os.cpu_count() or 1))
+    pool = _Workers(handlers, workers, affinity)
+
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, result, trace = await _handle(handlers, pool, method, path.split("?")[0], body)
+                except Exception as error:
+                    print(f"ERROR {method} {path}: {error!r}")
+                    status, result, trace = 500, {"error": "internal error"}, None
+                if trace is None:
+                    writer.write(_response(status, json.dumps(result).encode(), keep_alive))
+                else:
+                    with trace.phase("serialize"):
+                        response = _response(status, json.dumps(result).encode(), keep_alive)
+                    writer.write(response)
+                await writer.drain()
+                if trace is not None:
+                    tracing.emit(trace.finish())
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve():
+        host = "0.0.0.0"
+        port = int(os.environ.get("PORT", "8000"))
+        server = await asyncio.start_server(on_connection, host, port)
+        print(f"\nRunning Battlesnake at http://{host}:{port} with {workers} workers")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
@@ -10,11 +10,56 @@
 # To get you started we've included code to prevent your Battlesnake from moving backwards.
 # For more info see docs.battlesnake.com
 
+import itertools
+import os
 import random
 import typing
 import math
 import sys
+import time
+import zlib
 
+import mcts
+import rollouts
+import tracing
+from sessions import SessionStore
+from snake_state import DIRECTIONS, GameState
+from territory import region_size, territory_for
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# The game's timeout covers the whole round trip, so the search stops this
+# many milliseconds early to leave time for the network
+LATENCY_MARGIN_MS = 150
+DEFAULT_TIMEOUT_MS = 500
+MAX_SEARCH_DEPTH = 40
+# "paranoid": every searched opponent plays against us together (minimax).
+# "max-n": every snake plays for its own heuristic.
+SEARCH_MODE = "paranoid"
+# Only opponents whose head is this close to ours (Manhattan distance) are
+# searched; the others take their first safe move every turn
+NEARBY_DISTANCE = 6
+# heuristic points per cell of Voronoi territory more than the best opponent's
+TERRITORY_WEIGHT = 0.25
+
+# "minimax", "mcts", "rollouts" (batched NumPy rollouts of every first move),
+# or "alternate" to pick minimax or mcts per game from its id, so both play
+# the same kind of matches
+ENGINE = os.environ.get("ENGINE", "minimax")
+# processes for MCTS rollouts; more than 1 searches a tree in each and adds
+# up their root visits
+MCTS_WORKERS = int(os.environ.get("MCTS_WORKERS", "1"))
+
+# search state of every live game, kept between turns
+SESSIONS = SessionStore()
+
+def choose_engine(game_state):
+  if ENGINE == "alternate":
+    return ("minimax", "mcts")[zlib.crc32(game_state["game"]["id"].encode()) % 2]
+  return ENGINE
+
+def session_key(game_state):
+  # one session per snake we play in the game, in case two of them meet
+  return (game_state["game"]["id"], game_state["you"]["id"])
 
 # info is called when you create your Battlesnake on play.battlesnake.com
 # and controls your Battlesnake's appearance
@@ -39,9 +84,11 @@ def info() -> typing.Dict:
 # start is called when your Battlesnake begins a game
 def start(game_state: typing.Dict):
   print("GAME START")
+  SESSIONS.get(session_key(game_state))
 
 # end is called when your Battlesnake finishes a game
 def end(game_state: typing.Dict):
+  SESSIONS.end(session_key(game_state))
   if (game_state["board"]["snakes"]):
     print("GAME OVER: Winner is: " + game_state["board"]["snakes"][0]["name"])
   else:
@@ -101,35 +148,55 @@ def get_safe_moves(possible_moves, body, board):
 def move(game_state: typing.Dict) -> typing.Dict:
   possible_moves = ["up", "down", "left", "right"]
   if not (game_over(game_state)):
-    safe_moves = get_safe_moves(possible_moves, game_state["you"]["body"], game_state["board"])
-    if game_state["board"]["snakes"][1] == game_state["you"]:
-      max_player_index = 1
-      min_player_index = 0
-    else:
-      max_player_index = 0
-      min_player_index = 1
+    trace = tracing.current()
+    # search runs on a compact copy of the board built once per request
+    with trace.phase("state"):
+      state = GameState.from_json(game_state)
+    safe_moves = state.safe_moves(state.you)
+    max_player_index = state.you
+    opponents = nearby_opponents(state, state.you)
+    session = SESSIONS.get(session_key(game_state))
+    session.observe(state)
+    if session.engine is None:
+      session.engine = choose_engine(game_state)
   
+    timeout_ms = game_state["game"].get("timeout", DEFAULT_TIMEOUT_MS)
+    # short timeouts (offline matches) still get half their time
+    budget_ms = max(timeout_ms - LATENCY_MARGIN_MS, timeout_ms // 2)
+    start = time.perf_counter()
+    depth = 0
+    stats = SearchStats()
+    table = session.table
+    probes, hits = (table.probes, table.hits) if table is not None else (0, 0)
     if len(safe_moves)==1:
       next_move = safe_moves[0]
     elif len(safe_moves) > 1:
       #next_move = random.choice(safe_moves)
-      x = minimax(game_state,[True,max_player_index,min_player_index],7)
-      next_move = x[1]
+      if session.engine == "mcts":
+        if MCTS_WORKERS > 1:
+          next_move, stats.nodes = mcts.parallel_search(game_state, budget_ms, MCTS_WORKERS)
+        else:
+          next_move, stats.nodes = mcts.search(state, budget_ms, session)
+      elif session.engine == "rollouts":
+        next_move, stats.nodes = rollouts.search(state, budget_ms)
+      else:
+        x = iterative_deepening(state,[True,max_player_index,opponents],budget_ms,session=session,stats=stats,ordering=MoveOrdering())
+        next_move = x[1]
+        depth = x[2]
     else: 
       next_move = random.choice(possible_moves)
     
-      print(f"MOVE {game_state['turn']}: {next_move}")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    trace.add("search", elapsed_ms)
+    trace.set(engine=session.engine, move=next_move, depth=depth, budget_ms=budget_ms,
+      nodes=stats.nodes, cutoffs=stats.cutoffs, first_move_cutoffs=stats.first_move_cutoffs)
+    if session.table is not None:
+      table = session.table
+      if table.probes - probes:
+        trace.set(tt_probes=table.probes - probes, tt_hits=table.hits - hits, tt_filled=table.filled)
+    print(f"MOVE {game_state['turn']}: {next_move} ({session.engine}, depth {depth}, {elapsed_ms:.0f}ms of {budget_ms}ms, {stats.nodes} nodes, {stats.cutoffs} cutoffs)")
     return {"move": next_move}
-    print("tst5")
   return {"move": "none"}
-#added to update all snake body, not just snake head
-def nxt_move_state(snake_state,move):
-  snake_state["head"] = get_next(snake_state["head"],move)
-  snake_state["health"]-=1
-  for i in range(len(snake_state["body"])):
-    snake_state["body"][i] = get_next(snake_state["body"][i],move)
-  return(snake_state)
-  
 #copied from a previous version
 def manhattan_distance(pos1, pos2):
   return abs(pos1['x'] - pos2['x']) + abs(pos1['y'] - pos2['y'])
@@ -153,92 +220,344 @@ def game_over(game_state):
   
   return False
 
-#JoJo's minimax. It needs a couple improvements, mainly that our heuristic needs to be a lot better. Specifically if there is a game state that would lead to a loss it needs to be returned as a very large negative number for the max or very large positive for the min. Currently, if i'm not mistaken, the heuristic is just calculating the distance between heads
-def minimax (game_state,maximizing_player,depth,move="none"):
-  possible_moves = ["up", "down", "left", "right"]
-  if depth == 0 or game_over(game_state):  #base case of recursion, returns the heuristic
-    #heuristic = manhattan_distance(game_state["board"]["snakes"][maximizing_player[1]]["head"],game_state["board"]["snakes"][maximizing_player[2]]["head"])
-    if (maximizing_player):
-      player_index = maximizing_player[1]
-      opp_player_index = maximizing_player[2]
-    else:
-      player_index = maximizing_player[2]
-      opp_player_index = maximizing_player[1]
-      
-    safe_moves = get_safe_moves(possible_moves, game_state["board"]["snakes"][player_index]["body"], game_state["board"])
+def state_game_over(state):
+  # game_over() for a GameState
+  if not state.snakes[state.you].alive:
+    return True
+  if len(state.alive_snakes()) <= 1:
+    return True
+  if not any(state.food):
+    return True
+  return False
 
-    heuristic = 0
-    numUnsafeMoves = 4
-    
-    for potential_move in safe_moves:
-      numUnsafeMoves = numUnsafeMoves - 1
-  
-    if (numUnsafeMoves == 1):
-      heuristic = heuristic - 5
-    if (numUnsafeMoves == 2):
-      heuristic = heuristic - 10
-    if (numUnsafeMoves == 3):
-      heuristic = heuristic - 15
-    if (numUnsafeMoves == 4):
-      heuristic = heuristic - 1000
-  
-    hunger = game_state['board']['snakes'][player_index]['health']
-  
-    if (hunger < 20):
-      heuristic = heuristic - (20 - hunger)
-    
-    food = game_state['board']['food']
-    head = game_state['board']['snakes'][player_index]['head']
-
-    if not game_state['board']['food']:
-      min_food_distance = 122
-      for food_item in food:
-        distance_from_food = abs(food['x'] - head['x']) + abs(food['y'] - head['y'])
-        if distance_from_food < min_food_distance:
-          min_food_distance = distance_from_food
-            
-      if (min_food_distance <= 3):
-        heuristic = heuristic + (4 - min_food_distance)
-
-    fren_snek_len = len(game_state["board"]["snakes"][player_index]["body"])
-    op_snek_len = len(game_state["board"]["snakes"][opp_player_index]["body"])
-          
-    if (fren_snek_len > op_snek_len):
-      heuristic = heuristic + ((fren_snek_len - op_snek_len) * 2)
-  
-    snake_len = len(game_state['board']['snakes'][player_index])
-    heuristic = heuristic + (snake_len * 4)
-    return([heuristic,move])
+def nearby_opponents(state, player_index, distance=NEARBY_DISTANCE):
+  x, y = state.xy(state.snakes[player_index].body[0])
+  opponents = []
+  for i in state.alive_snakes():
+    if i != player_index:
+      other_x, other_y = state.xy(state.snakes[i].body[0])
+      if abs(x - other_x) + abs(y - other_y) <= distance:
+        opponents.append(i)
+  return opponents
+
+def heuristic(state, player_index, opponents):
+  if not state.snakes[player_index].alive:
+    return -1000
+  opponents = [i for i in opponents if state.snakes[i].alive]
+  if not opponents and len(state.alive_snakes()) == 1:
+    return 1000
+
+  safe_moves = state.safe_moves(player_index)
+
+  heuristic = 0
+  numUnsafeMoves = 4 - len(safe_moves)
+
+  if (numUnsafeMoves == 1):
+    heuristic = heuristic - 5
+  if (numUnsafeMoves == 2):
+    heuristic = heuristic - 10
+  if (numUnsafeMoves == 3):
+    heuristic = heuristic - 15
+  if (numUnsafeMoves == 4):
+    heuristic = heuristic - 1000
+
+  hunger = state.snakes[player_index].health
+
+  if (hunger < 20):
+    heuristic = heuristic - (20 - hunger)
+
+  # one multi-source BFS gives territory, room to move and food distance
+  territory, reachable, food_distance = territory_for(state).evaluate(state)
+
+  min_food_distance = food_distance[player_index]
+  if (min_food_distance is not None and min_food_distance <= 3):
+    heuristic = heuristic + (4 - min_food_distance)
+
+  # fewer free cells than segments: the snake is very likely trapped
+  if (reachable[player_index] < state.snakes[player_index].length):
+    heuristic = heuristic - 100
+
+  op_territory = max([territory[i] for i in opponents], default=0)
+  heuristic = heuristic + (territory[player_index] - op_territory) * TERRITORY_WEIGHT
+
+  fren_snek_len = state.snakes[player_index].length
+  op_snek_len = max([state.snakes[i].length for i in opponents], default=0)
+
+  if (opponents and fren_snek_len > op_snek_len):
+    heuristic = heuristic + ((fren_snek_len - op_snek_len) * 2)
+
+  return heuristic
+
+def snake_moves(state, index, session=None):
+  # moves to search for a snake, the ones it made most often so far first;
+  # one that is trapped still has to move
+  moves = state.safe_moves(index) or [DIRECTIONS[0]]
+  if session is not None and index != state.you:
+    moves = session.order_moves(state.snakes[index].id, moves)
+  return moves
+
+class SearchTimeout(Exception):
+  pass
+
+def search_key(state, maximizing_player):
+  # transposition table key: the same position scores differently for
+  # another snake or against another set of opponents
+  roles = state.keys.roles
+  key = state.hash ^ roles[maximizing_player[1]][0]
+  for i in maximizing_player[2]:
+    key ^= roles[i][1]
+  return key
+
+class SearchStats:
+  def __init__(self):
+    self.nodes = 0
+    # only cutoffs that skipped untried moves count, so nodes with a single
+    # move (no opponent nearby) do not inflate the first-move rate
+    self.cutoffs = 0
+    self.first_move_cutoffs = 0  # cutoffs made by the first move tried
+
+# Orders the moves tried at each node so alpha-beta cuts early. Our moves go:
+# the transposition table's best move, the killer move (the last move that
+# caused a cutoff at the same depth), then the rest, nearest food first when
+# we are hungry and then toward the biggest free region. Region sizes cost a
+# flood fill per move, so they are only used with at least voronoi_depth plies
+# left. Opponent replies go killer first, then the moves they made most often.
+class MoveOrdering:
+  def __init__(self, tt_move=True, killers=True, food=True, voronoi=True, hungry_health=30, voronoi_depth=4):
+    self.tt_move = tt_move
+    self.killers = {} if killers else None
+    self.food = food
+    self.voronoi = voronoi
+    self.hungry_health = hungry_health
+    self.voronoi_depth = voronoi_depth
+
+  def order(self, state, index, moves, depth, tt_move=None):
+    if len(moves) < 2:
+      return moves
+    snake = state.snakes[index]
+    head = snake.body[0]
+    width = state.width
+    food_cells = None
+    if self.food and snake.health < self.hungry_health:
+      food_cells = [cell for cell in range(len(state.food)) if state.food[cell]]
+    limit = 2 * snake.length + 4
+    killer = self.killers.get(depth) if self.killers is not None else None
+
+    def priority(direction):
+      if self.tt_move and direction == tt_move:
+        return (0, 0, 0)
+      if direction == killer:
+        return (1, 0, 0)
+      cell = state.next_cell(head, direction)
+      food_distance = 0
+      if food_cells:
+        x, y = cell % width, cell // width
+        food_distance = min(abs(x - food % width) + abs(y - food // width) for food in food_cells)
+      region = 0
+      if self.voronoi and depth >= self.voronoi_depth:
+        region = region_size(state, cell, limit)
+      return (2, food_distance, -region)
+
+    return sorted(moves, key=priority)
+
+  def order_replies(self, replies, depth):
+    killer = self.killers.get(depth) if self.killers is not None else None
+    if killer in replies:
+      replies.remove(killer)
+      replies.insert(0, killer)
+    return replies
+
+  def cutoff(self, move, depth):
+    if self.killers is not None:
+      self.killers[depth] = move
+
+  def clear(self):
+    if self.killers is not None:
+      self.killers.clear()
+
+#JoJo's minimax. It needs a couple improvements, mainly that our heuristic needs to be a lot better. Specifically if there is a game state that would lead to a loss it needs to be returned as a very large negative number for the max or very large positive for the min. Currently, if i'm not mistaken, the heuristic is just calculating the distance between heads
+# Runs on one GameState with make_moves/undo_moves. maximizing_player is
+# [is max node, our index, indices of the searched opponents]. Snakes move at
+# the same time, so our move is only remembered in `moves` and the turn is
+# played once the opponents have picked a joint reply (paranoid: they all
+# minimize our score); the leaf test is therefore only done on max nodes, where
+# the turn is complete. Returns (value, move, line), where line is our best
+# sequence of moves from this node.
+def minimax (state,maximizing_player,depth,move="none",moves=None,deadline=None,session=None,table=None,alpha=-math.inf,beta=math.inf,stats=None,ordering=None):
+  if deadline is not None and time.perf_counter() > deadline:
+    raise SearchTimeout
+  if stats is not None:
+    stats.nodes += 1
+  key = None
+  tt_move = None
+  if maximizing_player[0] and table is not None:
+    key = search_key(state, maximizing_player)
+    entry = table.probe(key)
+    # any stored result will do for a leaf; inner nodes need one searched as
+    # deep, and an exact value or a bound outside the window
+    if entry is not None:
+      entry_depth, entry_value, entry_move, flag = entry
+      if entry_move >= 0:
+        tt_move = DIRECTIONS[entry_move]
+      if depth <= 0 and flag == EXACT:
+        return([entry_value,move,[]])
+      if depth > 0 and entry_depth >= depth and tt_move is not None:
+        if flag == EXACT or (flag == LOWER and entry_value >= beta) or (flag == UPPER and entry_value <= alpha):
+          return(entry_value,tt_move,[tt_move])
+  if maximizing_player[0] and (depth <= 0 or state_game_over(state)):  #base case of recursion, returns the heuristic
+    value = heuristic(state, maximizing_player[1], maximizing_player[2])
+    if key is not None:
+      table.store(key, 0, value, -1, EXACT)
+    return([value,move,[]])
   elif maximizing_player[0]: #max function
-    best_value = -1000
-    safe_moves = get_safe_moves(possible_moves, game_state["board"]["snakes"][maximizing_player[1]]["body"], game_state["board"])
+    best_value = -math.inf
     best_move = "none"
-    for potential_move in safe_moves: #loop through possible moves
-      game_state["board"]["snakes"][maximizing_player[1]] = nxt_move_state(game_state["board"]["snakes"][maximizing_player[1]],potential_move) #calculates the next move
-      x = minimax(game_state,[False,maximizing_player[1],maximizing_player[2]],depth-1,potential_move)
+    best_line = []
+    alpha_original = alpha
+    # snakes outside the search take their most frequent safe move
+    moves = [snake_moves(state, i, session)[0] if snake.alive else None for i, snake in enumerate(state.snakes)]
+    our_moves = snake_moves(state, maximizing_player[1])
+    if ordering is not None:
+      our_moves = ordering.order(state, maximizing_player[1], our_moves, depth, tt_move)
+    for n, potential_move in enumerate(our_moves): #loop through possible moves
+      moves[maximizing_player[1]] = potential_move
+      x = minimax(state,[False,maximizing_player[1],maximizing_player[2]],depth-1,potential_move,moves,deadline,session,table,alpha,beta,stats,ordering)
       value = x[0]
       if value > best_value:
         best_move = potential_move
         best_value = value
-    return(best_value,best_move) #recursive call
+        best_line = [potential_move] + x[2]
+      alpha = max(alpha, value)
+      if alpha >= beta:
+        if stats is not None and n < len(our_moves) - 1:
+          stats.cutoffs += 1
+          stats.first_move_cutoffs += n == 0
+        if ordering is not None:
+          ordering.cutoff(potential_move, depth)
+        break
+    if key is not None:
+      if best_value <= alpha_original:
+        flag = UPPER
+      elif best_value >= beta:
+        flag = LOWER
+      else:
+        flag = EXACT
+      table.store(key, depth, best_value, DIRECTIONS.index(best_move), flag)
+    return(best_value,best_move,best_line) #recursive call
   else: #same as max but opposite
-    best_value = 1000
+    best_value = math.inf
     best_move = "none"
-    safe_moves = get_safe_moves(possible_moves, game_state["board"]["snakes"][maximizing_player[2]]["body"], game_state["board"])
-    for potential_move in safe_moves:
-      game_state["board"]["snakes"][maximizing_player[2]] = nxt_move_state (game_state["board"]["snakes"][maximizing_player[2]],potential_move)
-      x = minimax(game_state,[True,maximizing_player[1],maximizing_player[2]],depth-1,potential_move)
+    best_line = []
+    # opponents eliminated during the search have no moves to branch on
+    replying = [i for i in maximizing_player[2] if state.snakes[i].alive]
+    replies = list(itertools.product(*[snake_moves(state, i, session) for i in replying]))
+    if ordering is not None:
+      replies = ordering.order_replies(replies, depth)
+    for n, potential_moves in enumerate(replies):
+      for i, potential_move in zip(replying, potential_moves):
+        moves[i] = potential_move
+      state.make_moves(moves) #plays the turn for every snake
+      x = minimax(state,[True,maximizing_player[1],maximizing_player[2]],depth-1,move,None,deadline,session,table,alpha,beta,stats,ordering)
+      state.undo_moves()
       value = x[0]
-      move = x[1]
       
       if value < best_value:
-        best_move = move
+        best_move = x[1]
         best_value = value
+        best_line = x[2]
+      beta = min(beta, value)
+      if alpha >= beta:
+        if stats is not None and n < len(replies) - 1:
+          stats.cutoffs += 1
+          stats.first_move_cutoffs += n == 0
+        if ordering is not None:
+          ordering.cutoff(potential_moves, depth)
+        break
+
+    return(best_value,best_move,best_line)
+
+# Max-n: the snakes in `players` choose one after another, each taking the
+# move that is best for itself, and the turn is played after the last one.
+# Returns ({snake index: value}, move of players[turn], line of players[0]'s
+# moves) and, like minimax, counts depth in plies.
+def max_n(state, players, depth, turn=0, moves=None, deadline=None, session=None, stats=None):
+  if deadline is not None and time.perf_counter() > deadline:
+    raise SearchTimeout
+  if stats is not None:
+    stats.nodes += 1
+  if turn == 0 and (depth <= 0 or state_game_over(state)):
+    return ({i: heuristic(state, i, [j for j in players if j != i]) for i in players}, "none", [])
+  if turn == 0:
+    moves = [snake_moves(state, i, session)[0] if snake.alive else None for i, snake in enumerate(state.snakes)]
+  player = players[turn]
+  best_values = None
+  best_move = "none"
+  best_line = []
+  # a player eliminated during the search passes its turn without branching
+  player_moves = snake_moves(state, player, session) if state.snakes[player].alive else [None]
+  for potential_move in player_moves:
+    moves[player] = potential_move
+    if turn + 1 < len(players):
+      values, _, line = max_n(state, players, depth-1, turn+1, moves, deadline, session, stats)
+    else:
+      state.make_moves(moves)
+      values, _, line = max_n(state, players, depth-1, 0, None, deadline, session, stats)
+      state.undo_moves()
+    if best_values is None or values[player] > best_values[player]:
+      best_values = values
+      best_move = potential_move
+      best_line = [potential_move] + line if turn == 0 else line
+  return (best_values, best_move, best_line)
 
-    return(best_value,best_move)
+def iterative_deepening(state, maximizing_player, budget_ms, max_depth=MAX_SEARCH_DEPTH, mode=None, session=None, stats=None, ordering=None):
+  # Search one more turn at a time until the budget runs out, and return
+  # (value, move, depth) of the deepest search that finished. If not even one
+  # turn fits, fall back to the move last turn's search expected for this
+  # turn, or else the first safe move. The session keeps our expected line
+  # and the transposition table.
+  mode = mode or SEARCH_MODE
+  if session is not None:
+    if session.table is None:
+      session.table = TranspositionTable()
+    table = session.table
+  else:
+    table = TranspositionTable()
+  table.new_search()
+  deadline = time.perf_counter() + budget_ms / 1000
+  history = len(state.history)
+  players = [maximizing_player[1]] + list(maximizing_player[2])
+  safe_moves = snake_moves(state, maximizing_player[1])
+  fallback = safe_moves[0]
+  if session is not None and session.pv and session.pv[0] in safe_moves:
+    fallback = session.pv[0]
+  best = (-math.inf, fallback, 0)
+  line = []
+  ply = 2 if mode == "paranoid" else len(players)
+  for depth in range(ply, max_depth + 1, ply):
+    try:
+      if mode == "paranoid":
+        value, move, line = minimax(state, maximizing_player, depth, deadline=deadline, session=session, table=table,
+          stats=stats, ordering=ordering)
+      else:
+        values, move, line = max_n(state, players, depth, deadline=deadline, session=session, stats=stats)
+        value = values[maximizing_player[1]]
+    except SearchTimeout:
+      # unwind the turns the interrupted search had played
+      while len(state.history) > history:
+        state.undo_moves()
+      break
+    best = (value, move, depth)
+    if session is not None:
+      session.pv = line[1:]
+    if value <= -1000 or value >= 1000:
+      break  # the result is decided, deeper search will not change it
+  return best
 
 if __name__ == "__main__":
-  from server import run_server
+  if os.environ.get("SERVER") == "async":
+    from async_server import run_async_server as run_server
+  else:
+    from server import run_server
 
   run_server({
     "info": info, 
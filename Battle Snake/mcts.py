@@ -0,0 +1,206 @@
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from snake_state import DIRECTIONS, GameState
+
+# Decoupled-UCT Monte Carlo tree search for simultaneous moves.
+#
+# Every node keeps separate move statistics for each live snake. On the way
+# down each snake picks its own move by UCB1 from its own statistics, the
+# picks are played together as one turn, and the result of the rollout is
+# credited to each snake's pick. A rollout plays random safe moves (food
+# first when hungry, with the light policy) for up to ROLLOUT_TURNS turns.
+#
+# The tree is kept in the game's session. On the next turn, the child that
+# matches the moves the snakes actually made becomes the new root.
+
+EXPLORATION = 1.4
+ROLLOUT_TURNS = 20
+HUNGRY_HEALTH = 30
+
+
+class Node:
+    __slots__ = ("moves", "visits", "values", "children", "count")
+
+    def __init__(self, state):
+        # per snake index: its moves and their statistics, None if dead
+        self.moves = [None] * len(state.snakes)
+        self.visits = [None] * len(state.snakes)
+        self.values = [None] * len(state.snakes)
+        for i in state.alive_snakes():
+            moves = state.safe_moves(i) or [DIRECTIONS[0]]
+            self.moves[i] = moves
+            self.visits[i] = [0] * len(moves)
+            self.values[i] = [0.0] * len(moves)
+        self.children = {}  # tuple of moves (None for dead snakes) -> Node
+        self.count = 0
+
+    def select(self, index, rng):
+        visits = self.visits[index]
+        unvisited = [k for k, n in enumerate(visits) if n == 0]
+        if unvisited:
+            return rng.choice(unvisited)
+        values = self.values[index]
+        log_count = math.log(self.count)
+        best = 0
+        best_score = -math.inf
+        for k, n in enumerate(visits):
+            score = values[k] / n + EXPLORATION * math.sqrt(log_count / n)
+            if score > best_score:
+                best = k
+                best_score = score
+        return best
+
+    def best_move(self, index):
+        visits = self.visits[index]
+        return self.moves[index][max(range(len(visits)), key=visits.__getitem__)]
+
+
+def is_over(state):
+    return len(state.alive_snakes()) <= (1 if len(state.snakes) > 1 else 0)
+
+
+def rollout_move(state, index, rng, light):
+    moves = state.safe_moves(index)
+    if not moves:
+        return DIRECTIONS[0]
+    snake = state.snakes[index]
+    if light and snake.health < HUNGRY_HEALTH:
+        head = snake.body[0]
+        eating = [move for move in moves if state.food[state.next_cell(head, move)]]
+        if eating:
+            return eating[0]
+    return rng.choice(moves)
+
+
+def rewards(state):
+    # 1 for the last snake standing, 0.5 for surviving, 0 for dying
+    alive = state.alive_snakes()
+    result = [0.0] * len(state.snakes)
+    for i in alive:
+        result[i] = 1.0 if len(alive) == 1 and len(state.snakes) > 1 else 0.5
+    return result
+
+
+def rollout(state, rng, light=True, turns=ROLLOUT_TURNS):
+    played = 0
+    while played < turns and not is_over(state):
+        moves = [rollout_move(state, i, rng, light) if snake.alive else None for i, snake in enumerate(state.snakes)]
+        state.make_moves(moves)
+        played += 1
+    result = rewards(state)
+    for _ in range(played):
+        state.undo_moves()
+    return result
+
+
+def iterate(root, state, rng, light=True):
+    path = []
+    node = root
+    played = 0
+    while not is_over(state):
+        picks = [None] * len(state.snakes)
+        moves = [None] * len(state.snakes)
+        for i, snake_moves in enumerate(node.moves):
+            if snake_moves is not None:
+                picks[i] = node.select(i, rng)
+                moves[i] = snake_moves[picks[i]]
+        path.append((node, picks))
+        state.make_moves(moves)
+        played += 1
+        key = tuple(moves)
+        child = node.children.get(key)
+        if child is None:
+            node.children[key] = Node(state)
+            break
+        node = child
+    result = rollout(state, rng, light)
+    for _ in range(played):
+        state.undo_moves()
+    for node, picks in path:
+        node.count += 1
+        for i, k in enumerate(picks):
+            if k is not None:
+                node.visits[i][k] += 1
+                node.values[i][k] += result[i]
+    return result
+
+
+def reuse_tree(tree, state):
+    """
+    return the subtree of last turn's tree for the moves the snakes made, or
+    None when it cannot be matched (a snake died, or the tree is from
+    another turn)
+    """
+    if tree is None:
+        return None
+    root, ids, heads, turn = tree
+    if turn + 1 != state.turn or ids != tuple(snake.id for snake in state.snakes):
+        return None
+    moves = []
+    for snake, last in zip(state.snakes, heads):
+        direction = state.direction(last, snake.body[0])
+        if direction is None:
+            return None
+        moves.append(direction)
+    return root.children.get(tuple(moves))
+
+
+def search(state, budget_ms, session=None, seed=None, light=True):
+    """
+    search until budget_ms runs out and return (our move, iterations). With a
+    session, the tree is reused from and kept for the neighboring turns
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    rng = random.Random(seed)
+    root = reuse_tree(session.tree, state) if session is not None else None
+    if root is None or root.moves[state.you] is None:
+        root = Node(state)
+    iterations = 0
+    while time.perf_counter() < deadline:
+        iterate(root, state, rng, light)
+        iterations += 1
+    if session is not None:
+        session.tree = (root, tuple(snake.id for snake in state.snakes),
+                        [snake.body[0] for snake in state.snakes], state.turn)
+    return root.best_move(state.you), iterations
+
+
+def _search_worker(game_state, budget_ms, seed, light):
+    state = GameState.from_json(game_state)
+    root = Node(state)
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + budget_ms / 1000
+    while time.perf_counter() < deadline:
+        iterate(root, state, rng, light)
+    return dict(zip(root.moves[state.you], root.visits[state.you])), root.count
+
+
+_pool = None
+_pool_workers = 0
+
+
+def parallel_search(game_state, budget_ms, workers, seed=None, light=True):
+    """
+    root-parallel search: every worker process grows its own tree from the
+    request JSON and their root visit counts are added up. Returns (our
+    move, iterations)
+    """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(workers)
+        _pool_workers = workers
+    rng = random.Random(seed)
+    futures = [_pool.submit(_search_worker, game_state, budget_ms, rng.getrandbits(32), light) for _ in range(workers)]
+    visits = {}
+    iterations = 0
+    for future in futures:
+        counts, count = future.result()
+        iterations += count
+        for move, n in counts.items():
+            visits[move] = visits.get(move, 0) + n
+    return max(visits, key=visits.get), iterations
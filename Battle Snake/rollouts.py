@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+
+from snake_state import DIRECTIONS
+
+# Batched random rollouts with NumPy.
+#
+# K copies of a position are played out at once. Every board is a (H, W)
+# slice of two (K, H, W) arrays: `life`, the number of turns until the
+# segment on a cell leaves it (0 for empty, the snake's length for its
+# head), and `owner`, the index of the snake on it. Heads, health, lengths
+# and alive flags are (K, S) arrays for S snakes.
+#
+# A turn moves every snake in every game at once. Each picks uniformly among
+# its safe moves (no wall, no body; tails about to leave count as free), then
+# the standard rules apply as in GameState.make_moves: drop tails, lose
+# health, eat and grow, and eliminate snakes that starved, left the board,
+# hit a body or lost a head-to-head. Food does not respawn, as in mcts.
+#
+# estimate() splits the games between our safe first moves and returns how
+# often we win and survive after each of them.
+
+ROLLOUT_TURNS = 20
+BATCH_GAMES = 512
+
+
+class Rollouts:
+    def __init__(self, state, count, rng):
+        size = state.width * state.height
+        snakes = len(state.snakes)
+        self.rng = rng
+        self.you = state.you
+        self.games = np.arange(count)[:, None]
+        # (N, 4): the cell a head on each cell moves to, -1 off the board
+        self.neighbors = np.array([state.step[direction] for direction in DIRECTIONS], dtype=np.intp).T
+
+        life = np.zeros(size, np.int16)
+        owner = np.zeros(size, np.int8)
+        for i, snake in enumerate(state.snakes):
+            if not snake.alive:
+                continue
+            for j, cell in enumerate(snake.body):
+                if snake.length - j > life[cell]:
+                    life[cell] = snake.length - j
+                    owner[cell] = i
+        shape = (count, state.height, state.width)
+        self.life = np.broadcast_to(life.reshape(shape[1:]), shape).copy()
+        self.owner = np.broadcast_to(owner.reshape(shape[1:]), shape).copy()
+        food = np.frombuffer(bytes(state.food), np.uint8).astype(bool)
+        self.food = np.broadcast_to(food.reshape(shape[1:]), shape).copy()
+        # flat (K, N) views of the boards, indexed by packed cell
+        self.cells = self.life.reshape(count, size)
+        self.owners = self.owner.reshape(count, size)
+        self.food_cells = self.food.reshape(count, size)
+
+        def per_game(values, dtype):
+            return np.tile(np.array(values, dtype), (count, 1))
+
+        self.heads = per_game([snake.body[0] for snake in state.snakes], np.intp)
+        self.health = per_game([snake.health for snake in state.snakes], np.int16)
+        self.length = per_game([snake.length for snake in state.snakes], np.int16)
+        self.alive = per_game([snake.alive for snake in state.snakes], bool)
+        self.others = ~np.eye(snakes, dtype=bool)
+        self.last_snake = 1 if snakes > 1 else 0
+
+    def done(self):
+        # we are out, or the game is
+        return ~self.alive[:, self.you] | (self.alive.sum(1) <= self.last_snake)
+
+    def _remove(self, mask):
+        self.alive &= ~mask
+        self.cells[mask[self.games, self.owners] & (self.cells > 0)] = 0
+
+    def step(self, first_moves=None):
+        """
+        play one turn in every game that is not over; first_moves (index into
+        DIRECTIONS per game) overrides our random pick
+        """
+        games = self.games
+        active = self.alive & ~self.done()[:, None]
+        targets = self.neighbors[self.heads]  # (K, S, 4)
+        safe = (targets >= 0) & (self.cells[games[..., None], targets] <= 1)
+        scores = self.rng.random(safe.shape)
+        scores[~safe] = -1.0
+        picks = scores.argmax(2)  # with no safe move, the first one
+        if first_moves is not None:
+            picks[:, self.you] = first_moves
+        heads = np.take_along_axis(targets, picks[..., None], 2)[..., 0]
+
+        out = active & (heads < 0)
+        moving = active & ~out
+        heads = np.where(moving, heads, 0)
+        self.health[moving] -= 1
+        # every segment is one turn closer to leaving its cell
+        self.cells -= self.cells > 0
+
+        ate = moving & self.food_cells[games, heads]
+        self.health[ate] = 100
+        self.length[ate] += 1
+        # a snake that eats keeps its tail where it is for one more turn
+        self.cells += ate[games, self.owners] & (self.cells > 0)
+        eaters = np.nonzero(ate)
+        self.food_cells[eaters[0], heads[eaters]] = False
+
+        starved = moving & (self.health <= 0)
+        self._remove(out | starved)
+        moving &= ~starved
+
+        # collisions are judged against the snakes still on the board
+        hit = self.cells[games, heads] > 0
+        same = (heads[:, :, None] == heads[:, None, :]) & moving[:, None, :] & self.others
+        lost = (same & (self.length[:, None, :] >= self.length[:, :, None])).any(2)
+        collided = moving & (hit | lost)
+        self._remove(collided)
+
+        moved = np.nonzero(moving & ~collided)
+        self.cells[moved[0], heads[moved]] = self.length[moved]
+        self.owners[moved[0], heads[moved]] = moved[1]
+        self.heads[moved] = heads[moved]
+
+    def play(self, turns=ROLLOUT_TURNS, first_moves=None):
+        for turn in range(turns):
+            if self.done().all():
+                break
+            self.step(first_moves if turn == 0 else None)
+
+    def results(self):
+        """
+        return (won, survived) boolean arrays with one entry per game
+        """
+        survived = self.alive[:, self.you]
+        won = survived & (self.alive.sum(1) == 1) if self.last_snake else np.zeros_like(survived)
+        return won, survived
+
+
+def estimate(state, games=BATCH_GAMES, turns=ROLLOUT_TURNS, seed=None):
+    """
+    play about `games` random continuations split evenly between our safe
+    first moves and return {move: (win rate, survival rate)}
+    """
+    moves = state.safe_moves(state.you) or list(DIRECTIONS)
+    per_move = max(1, games // len(moves))
+    batch = Rollouts(state, per_move * len(moves), np.random.default_rng(seed))
+    batch.play(turns, np.repeat([DIRECTIONS.index(move) for move in moves], per_move))
+    won, survived = batch.results()
+    rates = {}
+    for k, move in enumerate(moves):
+        games = slice(k * per_move, (k + 1) * per_move)
+        rates[move] = (float(won[games].mean()), float(survived[games].mean()))
+    return rates
+
+
+def search(state, budget_ms, games=BATCH_GAMES, seed=None):
+    """
+    run batches of rollouts until budget_ms runs out and return (the move
+    with the best score, games played), scoring a win 1 and survival 0.5 as
+    mcts.rewards does
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    rng = np.random.default_rng(seed)
+    scores = {}
+    played = 0
+    batch_time = 0.0
+    # stop when the next batch would not finish in time, not after it
+    while not played or time.perf_counter() + batch_time < deadline:
+        start = time.perf_counter()
+        for move, (win, survival) in estimate(state, games, seed=rng.integers(2 ** 32)).items():
+            scores[move] = scores.get(move, 0.0) + win + 0.5 * (survival - win)
+        played += games
+        batch_time = time.perf_counter() - start
+    return max(scores, key=scores.get), played
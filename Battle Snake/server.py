@@ -1,34 +1,51 @@
+import json
 import logging
 import os
 import typing
 
 from flask import Flask
+from flask import Response
 from flask import request
 
+import tracing
+
 
 def run_server(handlers: typing.Dict):
     app = Flask("Battlesnake")
 
+    def traced(name, respond):
+        # time parsing, the handler and serialization as one trace
+        trace = tracing.begin(name)
+        with trace.phase("parse"):
+            game_state = request.get_json()
+        trace.set(game=game_state["game"]["id"], turn=game_state.get("turn"))
+        with trace.phase("handler"):
+            result = handlers[name](game_state)
+        with trace.phase("serialize"):
+            response = respond(result)
+        tracing.emit(tracing.end())
+        return response
+
     @app.get("/")
     def on_info():
         return handlers["info"]()
 
     @app.post("/start")
     def on_start():
-        game_state = request.get_json()
-        handlers["start"](game_state)
-        return "ok"
+        return traced("start", lambda result: "ok")
 
     @app.post("/move")
     def on_move():
-        game_state = request.get_json()
-        return handlers["move"](game_state)
+        return traced("move", lambda result: Response(json.dumps(result), mimetype="application/json"))
 
     @app.post("/end")
     def on_end():
-        game_state = request.get_json()
-        handlers["end"](game_state)
-        return "ok"
+        return traced("end", lambda result: "ok")
+
+    if os.environ.get("METRICS"):
+        @app.get("/metrics")
+        def on_metrics():
+            return tracing.METRICS.snapshot()
 
     @app.after_request
     def identify_server(response):
@@ -0,0 +1,76 @@
+from collections import Counter, OrderedDict
+
+# Search state kept between turns of one game, keyed by game.id (and our
+# snake id, see main.session_key).
+#
+# The store holds at most max_games sessions and drops the least recently
+# used one when a new game would go over the cap, so games whose /end never
+# arrives cannot pile up. Sessions live in the process that serves the game
+# (see async_server's worker affinity).
+
+MAX_GAMES = 64
+
+
+class Session:
+    __slots__ = ("game_id", "table", "pv", "opponent_moves", "last_heads", "turn", "engine", "tree")
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.table = None  # transposition table, created by the search
+        self.pv = []  # our moves expected from this turn on
+        self.opponent_moves = {}  # snake id -> Counter of directions it moved
+        self.last_heads = {}  # snake id -> head cell last turn
+        self.turn = -1
+        self.engine = None  # "minimax" or "mcts", picked on the first turn
+        self.tree = None  # MCTS tree kept for the next turn, see mcts.search
+
+    def observe(self, state):
+        """
+        count the direction every other snake moved since the last turn
+        """
+        heads = {}
+        for i, snake in enumerate(state.snakes):
+            if i == state.you or not snake.alive:
+                continue
+            head = snake.body[0]
+            heads[snake.id] = head
+            last = self.last_heads.get(snake.id)
+            if last is None or state.turn != self.turn + 1:
+                continue
+            direction = state.direction(last, head)
+            if direction is None:
+                continue
+            self.opponent_moves.setdefault(snake.id, Counter())[direction] += 1
+        self.last_heads = heads
+        self.turn = state.turn
+
+    def order_moves(self, snake_id, moves):
+        """
+        moves sorted by how often the snake made each one before
+        """
+        counts = self.opponent_moves.get(snake_id)
+        if not counts:
+            return moves
+        return sorted(moves, key=lambda direction: -counts[direction])
+
+
+class SessionStore:
+    def __init__(self, max_games=MAX_GAMES):
+        self.max_games = max_games
+        self.sessions = OrderedDict()
+
+    def get(self, game_id):
+        session = self.sessions.get(game_id)
+        if session is None:
+            session = self.sessions[game_id] = Session(game_id)
+            while len(self.sessions) > self.max_games:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(game_id)
+        return session
+
+    def end(self, game_id):
+        self.sessions.pop(game_id, None)
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,274 @@
+# Offline Battle Snake matches under the standard ruleset.
+#
+#   python simulate.py main simple --games 100 --jobs 4 --seed 0
+#   python simulate.py main http://localhost:8001 --timeout 300 --output run.json
+#
+# An agent is the name of a module with info/start/move/end handlers ("main",
+# "simple"), whose handlers are called directly, or the URL of a running
+# snake server. "main:mcts" plays main with its ENGINE set to mcts, so the
+# engines can be compared in the same matches; plain "main" plays with the
+# module's default ENGINE. simple.py is seeded from the game seed so runs
+# repeat.
+# Games are spread across processes. The report gives every agent's win rate,
+# average turns survived, move latency percentiles and the number of moves
+# that took longer than the game timeout.
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import random
+import sys
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from snake_state import DIRECTIONS, GameState, Snake
+
+MINIMUM_FOOD = 1
+FOOD_SPAWN_CHANCE = 15  # percent, per turn once MINIMUM_FOOD is on the board
+MAX_TURNS = 2000
+
+# module name -> its ENGINE as imported, before any agent overrode it
+_default_engines = {}
+
+
+class ModuleAgent:
+    def __init__(self, name, seed, engine=None):
+        self.module = importlib.import_module(name)
+        self.engine = engine
+        self.default_engine = _default_engines.setdefault(name, getattr(self.module, "ENGINE", None))
+        if hasattr(self.module, "random_seed"):
+            self.module.random_seed = seed
+
+    def call(self, name, game_state, timeout_ms):
+        if hasattr(self.module, "ENGINE"):
+            # agents may share the module, so set it before every call
+            self.module.ENGINE = self.engine or self.default_engine
+        with contextlib.redirect_stdout(io.StringIO()):
+            return getattr(self.module, name)(game_state)
+
+
+class HttpAgent:
+    def __init__(self, url, seed):
+        self.url = url.rstrip("/")
+
+    def call(self, name, game_state, timeout_ms):
+        request = urllib.request.Request(
+            self.url + "/" + name,
+            data=json.dumps(game_state).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout_ms / 1000 * 2) as response:
+                body = response.read()
+        except OSError:
+            return None
+        return json.loads(body) if name == "move" else None
+
+
+def make_agent(spec, seed):
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return HttpAgent(spec, seed)
+    name, _, engine = spec.partition(":")
+    return ModuleAgent(name, seed, engine or None)
+
+
+def start_positions(width, height):
+    # the standard fixed spots: corners, then the middle of each edge
+    low_x, low_y, high_x, high_y = 1, 1, width - 2, height - 2
+    mid_x, mid_y = (width - 1) // 2, (height - 1) // 2
+    corners = [(low_x, low_y), (low_x, high_y), (high_x, low_y), (high_x, high_y)]
+    edges = [(low_x, mid_y), (mid_x, low_y), (high_x, mid_y), (mid_x, high_y)]
+    return corners, edges
+
+
+def new_game(count, width, height, rng):
+    state = GameState(width, height)
+    corners, edges = start_positions(width, height)
+    rng.shuffle(corners)
+    rng.shuffle(edges)
+    spots = (corners + edges)[:count]
+    for i, (x, y) in enumerate(spots):
+        cell = state.cell(x, y)
+        state.grid[cell] += 3
+        state.snakes.append(Snake("snake-%d" % i, deque([cell] * 3), 100))
+    # one food next to each snake, on the side away from the center, and one
+    # in the center
+    mid_x, mid_y = (width - 1) // 2, (height - 1) // 2
+    center = (mid_x, mid_y)
+    for x, y in spots:
+        options = [
+            (x + dx, y + dy) for dx, dy in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+            if 0 <= x + dx < width and 0 <= y + dy < height
+            and abs(x + dx - mid_x) + abs(y + dy - mid_y) >= abs(x - mid_x) + abs(y - mid_y)
+            and (x + dx, y + dy) != center
+        ]
+        if options:
+            fx, fy = rng.choice(options)
+            state.food[state.cell(fx, fy)] = 1
+    if not state.grid[state.cell(*center)]:
+        state.food[state.cell(*center)] = 1
+    state.rehash()
+    return state
+
+
+def spawn_food(state, rng):
+    count = sum(state.food)
+    spawn = MINIMUM_FOOD - count if count < MINIMUM_FOOD else int(rng.randrange(100) < FOOD_SPAWN_CHANCE)
+    free = [cell for cell in range(len(state.grid)) if not state.grid[cell] and not state.food[cell]]
+    rng.shuffle(free)
+    for cell in free[:spawn]:
+        state.food[cell] = 1
+
+
+def game_json(state, game_id, timeout_ms, index):
+    def point(cell):
+        x, y = state.xy(cell)
+        return {"x": x, "y": y}
+
+    def snake_json(snake):
+        body = [point(cell) for cell in snake.body]
+        return {
+            "id": snake.id, "name": snake.id, "health": snake.health, "body": body,
+            "head": body[0], "length": len(body), "latency": "0", "shout": "",
+        }
+
+    snakes = [snake_json(snake) for snake in state.snakes if snake.alive]
+    you = snake_json(state.snakes[index])
+    return {
+        "game": {"id": game_id, "ruleset": {"name": "standard", "version": "v1.0.0"}, "timeout": timeout_ms},
+        "turn": state.turn,
+        "board": {
+            "width": state.width, "height": state.height,
+            "food": [point(cell) for cell in range(len(state.food)) if state.food[cell]],
+            "hazards": [], "snakes": snakes,
+        },
+        "you": you,
+    }
+
+
+def play_game(specs, seed, width=11, height=11, timeout_ms=500):
+    """
+    play one game between the agents in specs (agent i is snake i) and return
+    the winner's index (None for a draw), the turn each snake was eliminated
+    on and every agent's move latencies in milliseconds
+    """
+    rng = random.Random(seed)
+    agents = [make_agent(spec, rng.getrandbits(32)) for spec in specs]
+    state = new_game(len(specs), width, height, rng)
+    game_id = "sim-%d" % seed
+    latencies = [[] for _ in specs]
+    timeouts = [0] * len(specs)
+    last_moves = [DIRECTIONS[0]] * len(specs)
+    survived = [None] * len(specs)
+
+    for i, agent in enumerate(agents):
+        agent.call("start", game_json(state, game_id, timeout_ms, i), timeout_ms)
+    while len(state.alive_snakes()) > (1 if len(specs) > 1 else 0) and state.turn < MAX_TURNS:
+        moves = [None] * len(specs)
+        for i in state.alive_snakes():
+            request = game_json(state, game_id, timeout_ms, i)
+            start = time.perf_counter()
+            response = agents[i].call("move", request, timeout_ms)
+            elapsed = (time.perf_counter() - start) * 1000
+            latencies[i].append(elapsed)
+            direction = response.get("move") if response else None
+            if elapsed > timeout_ms or direction not in DIRECTIONS:
+                # the server keeps a snake that is late or answers nonsense
+                # going the way it went last
+                timeouts[i] += elapsed > timeout_ms
+                direction = last_moves[i]
+            moves[i] = last_moves[i] = direction
+        state.make_moves(moves)
+        for i, snake in enumerate(state.snakes):
+            if not snake.alive and survived[i] is None:
+                survived[i] = state.turn
+        spawn_food(state, rng)
+
+    alive = state.alive_snakes()
+    for i in alive:
+        survived[i] = state.turn
+    winner = alive[0] if len(alive) == 1 and len(specs) > 1 else None
+    for i, agent in enumerate(agents):
+        agent.call("end", game_json(state, game_id, timeout_ms, i), timeout_ms)
+    return {"seed": seed, "winner": winner, "turns": state.turn, "survived": survived,
+            "latencies_ms": latencies, "timeouts": timeouts}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(specs, games):
+    n = len(games)
+    summary = {"games": n, "agents": []}
+    for i, spec in enumerate(specs):
+        latencies = [ms for game in games for ms in game["latencies_ms"][i]]
+        wins = sum(1 for game in games if game["winner"] == i)
+        summary["agents"].append({
+            "spec": spec,
+            "wins": wins,
+            "win_rate": wins / n if n else 0.0,
+            "average_turns_survived": sum(game["survived"][i] for game in games) / n if n else 0.0,
+            "moves": len(latencies),
+            "timeouts": sum(game["timeouts"][i] for game in games),
+            "latency_ms": {name: percentile(latencies, q)
+                           for name, q in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))},
+        })
+    summary["draws"] = sum(1 for game in games if game["winner"] is None)
+    summary["average_game_length"] = sum(game["turns"] for game in games) / n if n else 0.0
+    return summary
+
+
+def run_match(specs, games, jobs=None, seed=0, width=11, height=11, timeout_ms=500):
+    seeds = [seed + i for i in range(games)]
+    args = ([specs] * games, seeds, [width] * games, [height] * games, [timeout_ms] * games)
+    if jobs == 1:
+        results = list(map(play_game, *args))
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(play_game, *args))
+    return summarize(specs, results)
+
+
+def print_summary(summary):
+    print("%d games, %.1f turns per game, %d draws" % (
+        summary["games"], summary["average_game_length"], summary["draws"]))
+    for agent in summary["agents"]:
+        latency = agent["latency_ms"]
+        print("  %-24s win %.3f  survived %.1f turns  latency p50 %.1fms p90 %.1fms p99 %.1fms  %d timeouts" % (
+            agent["spec"], agent["win_rate"], agent["average_turns_survived"],
+            latency["p50"] or 0, latency["p90"] or 0, latency["p99"] or 0, agent["timeouts"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Battle Snake agents against each other offline.")
+    parser.add_argument("agents", nargs="+", help="module names (main, simple) or snake server URLs")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--timeout", type=int, default=500, help="move timeout in milliseconds")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    summary = run_match(args.agents, args.games, args.jobs, args.seed, args.width, args.height, args.timeout)
+    summary["config"] = {"agents": args.agents, "games": args.games, "seed": args.seed,
+                         "width": args.width, "height": args.height, "timeout": args.timeout}
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import random
+import typing
+from collections import deque
+
+# Compact game state for search, built once per request from the game JSON.
+#
+# Cells are packed into one int, y * width + x. The board keeps an occupancy
+# grid (number of snake segments on each cell) and a food grid as bytearrays,
+# so checking whether a cell is free is a single lookup. Moving a head is a
+# lookup too, in neighbor tables shared by every state on the same board
+# shape, which also handle the wrapped ruleset.
+#
+# make_moves() plays one turn for every snake at once under the standard
+# rules and pushes an undo record, and undo_moves() pops it, so a search can
+# walk the tree on a single state without copying it.
+#
+# The state also keeps a Zobrist hash of the position (every snake's body
+# cells, head, length and health bucket, and the food), updated as moves are
+# made, to key transposition tables. Bodies are hashed as sets of cells, so
+# two bodies on the same cells with the same head hash alike.
+
+DIRECTIONS = ("up", "down", "left", "right")
+HEALTH_BUCKET = 10  # health values hashed alike
+MAX_SNAKES = 16
+
+
+class ZobristKeys:
+    """
+    random keys for one board size; use zobrist_keys() to share them
+    """
+
+    def __init__(self, size):
+        rng = random.Random(size)
+
+        def table(count):
+            return [rng.getrandbits(64) for _ in range(count)]
+
+        self.body = [table(size) for _ in range(MAX_SNAKES)]
+        self.head = [table(size) for _ in range(MAX_SNAKES)]
+        self.length = [table(size + 1) for _ in range(MAX_SNAKES)]
+        self.health = [table(100 // HEALTH_BUCKET + 1) for _ in range(MAX_SNAKES)]
+        self.food = table(size)
+        # xored into the hash by a search: roles[i][0] if snake i is the one
+        # searching, roles[i][1] if it is a searched opponent
+        self.roles = [table(2) for _ in range(MAX_SNAKES)]
+
+
+class NeighborTable:
+    """
+    moves on one board shape: step[direction][cell] is where a head on cell
+    goes that way (-1 off the board), adjacent[cell] the cells next to it.
+    Use neighbor_table() to share them
+    """
+
+    def __init__(self, width, height, wrapped=False):
+        self.step = {}
+        for direction, dx, dy in (("up", 0, 1), ("down", 0, -1), ("left", -1, 0), ("right", 1, 0)):
+            table = []
+            for cell in range(width * height):
+                x, y = cell % width + dx, cell // width + dy
+                if wrapped:
+                    x, y = x % width, y % height
+                table.append(y * width + x if 0 <= x < width and 0 <= y < height else -1)
+            self.step[direction] = table
+        self.steps = tuple((direction, self.step[direction]) for direction in DIRECTIONS)
+        self.adjacent = [
+            tuple(table[cell] for _, table in self.steps if table[cell] >= 0)
+            for cell in range(width * height)
+        ]
+
+
+_neighbor_tables = {}
+
+
+def neighbor_table(width, height, wrapped=False):
+    key = (width, height, wrapped)
+    table = _neighbor_tables.get(key)
+    if table is None:
+        table = _neighbor_tables[key] = NeighborTable(width, height, wrapped)
+    return table
+
+
+_zobrist_keys = {}
+
+
+def zobrist_keys(size):
+    keys = _zobrist_keys.get(size)
+    if keys is None:
+        keys = _zobrist_keys[size] = ZobristKeys(size)
+    return keys
+
+
+class Snake:
+    __slots__ = ("id", "body", "health", "length", "alive")
+
+    def __init__(self, id, body, health):
+        self.id = id
+        self.body = body  # deque of packed cells, head first
+        self.health = health
+        self.length = len(body)
+        self.alive = True
+
+    def copy(self):
+        snake = Snake(self.id, deque(self.body), self.health)
+        snake.alive = self.alive
+        return snake
+
+    @property
+    def head(self):
+        return self.body[0]
+
+    @property
+    def tail(self):
+        return self.body[-1]
+
+
+class GameState:
+    __slots__ = ("width", "height", "wrapped", "step", "steps", "adjacent", "grid", "food", "snakes", "you", "turn",
+                 "history", "keys", "hash")
+
+    def __init__(self, width, height, wrapped=False):
+        self.width = width
+        self.height = height
+        self.wrapped = wrapped
+        neighbors = neighbor_table(width, height, wrapped)
+        self.step = neighbors.step
+        self.steps = neighbors.steps
+        self.adjacent = neighbors.adjacent
+        self.grid = bytearray(width * height)
+        self.food = bytearray(width * height)
+        self.snakes = []
+        self.you = 0  # index of our snake in snakes
+        self.turn = 0
+        self.history = []  # undo records, one per make_moves
+        self.keys = zobrist_keys(width * height)
+        self.hash = 0  # see rehash()
+
+    @classmethod
+    def from_json(cls, game_state: typing.Dict) -> "GameState":
+        board = game_state["board"]
+        ruleset = game_state.get("game", {}).get("ruleset", {}).get("name")
+        state = cls(board["width"], board["height"], ruleset == "wrapped")
+        state.turn = game_state.get("turn", 0)
+        for food in board["food"]:
+            state.food[state.cell(food["x"], food["y"])] = 1
+        you_id = game_state["you"]["id"]
+        for snake_json in board["snakes"]:
+            body = deque(state.cell(part["x"], part["y"]) for part in snake_json["body"])
+            for cell in body:
+                state.grid[cell] += 1
+            if snake_json["id"] == you_id:
+                state.you = len(state.snakes)
+            state.snakes.append(Snake(snake_json["id"], body, snake_json["health"]))
+        state.rehash()
+        return state
+
+    def copy(self) -> "GameState":
+        state = GameState.__new__(GameState)
+        state.width = self.width
+        state.height = self.height
+        state.wrapped = self.wrapped
+        state.step = self.step
+        state.steps = self.steps
+        state.adjacent = self.adjacent
+        state.grid = bytearray(self.grid)
+        state.food = bytearray(self.food)
+        state.snakes = [snake.copy() for snake in self.snakes]
+        state.you = self.you
+        state.turn = self.turn
+        state.history = []
+        state.keys = self.keys
+        state.hash = self.hash
+        return state
+
+    def snake_hash(self, index):
+        keys = self.keys
+        snake = self.snakes[index]
+        h = keys.head[index][snake.body[0]]
+        h ^= keys.length[index][min(snake.length, len(self.grid))]
+        h ^= keys.health[index][max(snake.health, 0) // HEALTH_BUCKET]
+        body = keys.body[index]
+        for cell in snake.body:
+            h ^= body[cell]
+        return h
+
+    def rehash(self):
+        """
+        compute the hash from scratch; make_moves keeps it up to date after
+        """
+        h = 0
+        for i, snake in enumerate(self.snakes):
+            if snake.alive:
+                h ^= self.snake_hash(i)
+        food = self.keys.food
+        for cell, has_food in enumerate(self.food):
+            if has_food:
+                h ^= food[cell]
+        self.hash = h
+
+    def cell(self, x, y):
+        return y * self.width + x
+
+    def xy(self, cell):
+        return cell % self.width, cell // self.width
+
+    def next_cell(self, cell, direction):
+        """
+        return the cell the head moves to going that way, or -1 off the board
+        """
+        return self.step[direction][cell]
+
+    def direction(self, cell, next_cell):
+        """
+        return the direction that moves a head from cell to next_cell, or None
+        if they are not neighbors
+        """
+        for direction, table in self.steps:
+            if table[cell] == next_cell:
+                return direction
+        return None
+
+    def is_free(self, cell):
+        # A cell is free if no snake segment is on it, other than the tails,
+        # which move away this turn (same rule as main.get_safe_moves)
+        count = self.grid[cell]
+        if count == 0:
+            return True
+        for snake in self.snakes:
+            if snake.alive and snake.body[-1] == cell:
+                count -= 1
+        return count == 0
+
+    def safe_moves(self, index):
+        head = self.snakes[index].body[0]
+        moves = []
+        for direction, table in self.steps:
+            cell = table[head]
+            if cell >= 0 and self.is_free(cell):
+                moves.append(direction)
+        return moves
+
+    def alive_snakes(self):
+        return [i for i, snake in enumerate(self.snakes) if snake.alive]
+
+    def make_moves(self, moves):
+        """
+        play one turn: moves[i] is the direction of snake i (ignored for
+        eliminated snakes). Follows the standard rules: move heads and drop
+        tails, lose 1 health, eat and grow, then eliminate snakes that
+        starved, left the board, hit a body or lost a head-to-head
+        """
+        grid = self.grid
+        food = self.food
+        moved = []  # (index, dropped tail) of every snake that moved
+        eaten = []
+        out = []  # left the board this turn; these keep their old body
+        healths = [snake.health for snake in self.snakes]
+        old_hash = self.hash
+        keys = self.keys
+        size = len(grid)
+        h = old_hash
+        for i, snake in enumerate(self.snakes):
+            if not snake.alive:
+                continue
+            cell = self.step[moves[i]][snake.body[0]]
+            if cell < 0:
+                out.append(i)
+                continue
+            body = snake.body
+            body.appendleft(cell)
+            grid[cell] += 1
+            tail = body.pop()
+            grid[tail] -= 1
+            snake.health -= 1
+            moved.append((i, tail))
+            h ^= keys.head[i][body[1] if len(body) > 1 else tail] ^ keys.head[i][cell]
+            h ^= keys.body[i][cell] ^ keys.body[i][tail]
+
+        grew = []
+        for i, tail in moved:
+            snake = self.snakes[i]
+            head = snake.body[0]
+            if food[head]:
+                snake.health = 100
+                snake.body.append(snake.body[-1])
+                grid[snake.body[-1]] += 1
+                h ^= keys.body[i][snake.body[-1]]
+                h ^= keys.length[i][min(snake.length, size)] ^ keys.length[i][min(snake.length + 1, size)]
+                snake.length += 1
+                grew.append(i)
+                eaten.append(head)
+            health = keys.health[i]
+            h ^= health[max(healths[i], 0) // HEALTH_BUCKET] ^ health[max(snake.health, 0) // HEALTH_BUCKET]
+        for cell in set(eaten):
+            food[cell] = 0
+            h ^= keys.food[cell]
+        self.hash = h
+
+        eliminated = out + [i for i, _ in moved if self.snakes[i].health <= 0]
+        for i in eliminated:
+            self._remove(i)
+
+        # collisions are judged against the snakes still on the board
+        survivors = [i for i, _ in moved if self.snakes[i].alive]
+        heads = {}
+        for i in survivors:
+            head = self.snakes[i].body[0]
+            heads[head] = heads.get(head, 0) + 1
+        collided = []
+        for i in survivors:
+            snake = self.snakes[i]
+            head = snake.body[0]
+            if grid[head] > heads[head]:
+                collided.append(i)
+                continue
+            if heads[head] > 1:
+                for j in survivors:
+                    if j != i and self.snakes[j].body[0] == head and self.snakes[j].length >= snake.length:
+                        collided.append(i)
+                        break
+        for i in collided:
+            self._remove(i)
+
+        self.turn += 1
+        self.history.append((moved, grew, eaten, eliminated + collided, healths, old_hash))
+
+    def undo_moves(self):
+        """
+        take back the last make_moves
+        """
+        moved, grew, eaten, eliminated, healths, old_hash = self.history.pop()
+        grid = self.grid
+        for i in eliminated:
+            self._restore(i)
+        for cell in eaten:
+            self.food[cell] = 1
+        for i in grew:
+            snake = self.snakes[i]
+            grid[snake.body.pop()] -= 1
+            snake.length -= 1
+        for i, tail in moved:
+            body = self.snakes[i].body
+            body.append(tail)
+            grid[tail] += 1
+            grid[body.popleft()] -= 1
+        for snake, health in zip(self.snakes, healths):
+            snake.health = health
+        self.turn -= 1
+        self.hash = old_hash
+
+    def _remove(self, index):
+        snake = self.snakes[index]
+        self.hash ^= self.snake_hash(index)
+        snake.alive = False
+        for cell in snake.body:
+            self.grid[cell] -= 1
+
+    def _restore(self, index):
+        snake = self.snakes[index]
+        snake.alive = True
+        for cell in snake.body:
+            self.grid[cell] += 1
@@ -0,0 +1,140 @@
+import threading
+from array import array
+
+# Voronoi territory for leaf scoring.
+#
+# One breadth-first search starts from every live head at once. A cell
+# belongs to the snake that reaches it first; cells reached first by two or
+# more snakes at the same distance are contested and the search does not
+# continue through them. A body segment blocks the search only until the
+# turn its snake's tail has moved off it.
+#
+# The search buffers are reused between calls, one set per board size and
+# thread, since the Flask server handles requests on threads.
+
+UNREACHED = 0xFFFF
+
+
+class Territory:
+    """
+    search buffers for one board size; use territory_for() to get this
+    thread's
+    """
+
+    def __init__(self, width, height):
+        size = width * height
+        self.width = width
+        self.height = height
+        self.distance = array("H", [UNREACHED]) * size
+        self.owners = array("H", [0]) * size  # bit i set: snake i got here first
+        self.vacate = array("H", [0]) * size  # turn a body segment leaves the cell
+        self._unreached = array("H", [UNREACHED]) * size
+        self._zeros = array("H", [0]) * size
+
+    def evaluate(self, state):
+        """
+        return (territory, reachable, food_distance), indexed like
+        state.snakes:
+          territory[i]      cells snake i reaches strictly first
+          reachable[i]      territory[i] plus the contested cells snake i shares
+          food_distance[i]  moves to the nearest food snake i reaches first or
+                            ties on, or None
+        """
+        adjacent = state.adjacent
+        distance = self.distance
+        owners = self.owners
+        vacate = self.vacate
+        food = state.food
+        distance[:] = self._unreached
+        owners[:] = self._zeros
+        vacate[:] = self._zeros
+
+        frontier = []
+        for i, snake in enumerate(state.snakes):
+            if not snake.alive:
+                continue
+            length = len(snake.body)
+            for k, cell in enumerate(snake.body):
+                if length - k > vacate[cell]:
+                    vacate[cell] = length - k
+            head = snake.body[0]
+            if distance[head] == UNREACHED:
+                distance[head] = 0
+                frontier.append(head)
+            owners[head] |= 1 << i
+
+        count = len(state.snakes)
+        territory = [0] * count
+        reachable = [0] * count
+        food_distance = [None] * count
+        step = 0
+        while frontier:
+            step += 1
+            next_frontier = []
+            for cell in frontier:
+                owner = owners[cell]
+                if owner & (owner - 1):
+                    continue  # contested
+                for neighbor in adjacent[cell]:
+                    if vacate[neighbor] > step:
+                        continue
+                    if distance[neighbor] == UNREACHED:
+                        distance[neighbor] = step
+                        owners[neighbor] = owner
+                        next_frontier.append(neighbor)
+                    elif distance[neighbor] == step:
+                        owners[neighbor] |= owner
+            # owners are final once the whole layer is done
+            for cell in next_frontier:
+                owner = owners[cell]
+                contested = owner & (owner - 1)
+                i = 0
+                while owner:
+                    if owner & 1:
+                        reachable[i] += 1
+                        if not contested:
+                            territory[i] += 1
+                        if food[cell] and food_distance[i] is None:
+                            food_distance[i] = step
+                    owner >>= 1
+                    i += 1
+            frontier = next_frontier
+
+        return territory, reachable, food_distance
+
+
+_local = threading.local()
+
+
+def territory_for(state):
+    """
+    this thread's Territory for the board size
+    """
+    territories = getattr(_local, "territories", None)
+    if territories is None:
+        territories = _local.territories = {}
+    key = (state.width, state.height)
+    territory = territories.get(key)
+    if territory is None:
+        territory = territories[key] = Territory(state.width, state.height)
+    return territory
+
+
+def region_size(state, cell, limit):
+    """
+    number of free cells reachable from cell, counting up to limit
+    """
+    if cell < 0 or not state.is_free(cell):
+        return 0
+    adjacent = state.adjacent
+    seen = {cell}
+    frontier = [cell]
+    while frontier and len(seen) < limit:
+        next_frontier = []
+        for cell in frontier:
+            for neighbor in adjacent[cell]:
+                if neighbor not in seen and state.is_free(neighbor):
+                    seen.add(neighbor)
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return min(len(seen), limit)
@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-request timing and structured tracing.
+#
+# The server opens a Trace for every request, handlers add the time of their
+# own phases and their search counters to it, and when the response is
+# written the whole record goes out as one JSON line:
+#
+#   {"handler": "move", "time": 1700000000.1, "game": "...", "turn": 12,
+#    "timings_ms": {"parse": 0.2, "state": 0.1, "search": 348.9,
+#                   "handler": 349.3, "serialize": 0.0, "total": 349.7},
+#    "engine": "minimax", "depth": 12, "nodes": 15091, ...}
+#
+# TRACE names the file the lines are appended to ("-" for stderr); without
+# it nothing is written. The last METRICS_WINDOW timings of every phase are
+# kept for the optional /metrics endpoint either way.
+#
+# The current trace is kept per thread (and per asyncio task), since the
+# Flask server handles requests on threads.
+
+TRACE = os.environ.get("TRACE")
+METRICS_WINDOW = 1000
+
+
+class Trace:
+    def __init__(self, handler):
+        self.record = {"handler": handler, "time": time.time()}
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def merge(self, record):
+        """
+        take over the fields and timings of a record finished elsewhere (a
+        worker process)
+        """
+        timings = record.pop("timings_ms", {})
+        record.pop("time", None)
+        self.record.update(record)
+        for name, ms in timings.items():
+            self.add(name, ms)
+
+    def finish(self):
+        self.add("total", (time.perf_counter() - self.started) * 1000)
+        self.record["timings_ms"] = {name: round(ms, 3) for name, ms in self.timings.items()}
+        return self.record
+
+
+class _NullTrace(Trace):
+    # what handlers see when no server is tracing them (offline matches)
+    def __init__(self):
+        super().__init__(None)
+
+    def add(self, name, ms):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_TRACE = _NullTrace()
+_current = ContextVar("trace", default=None)
+
+
+def begin(handler):
+    trace = Trace(handler)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    trace = _current.get()
+    return trace if trace is not None else _NULL_TRACE
+
+
+def end():
+    """
+    finish the current trace and return its record
+    """
+    trace = _current.get()
+    _current.set(None)
+    return trace.finish()
+
+
+class Metrics:
+    """
+    rolling latency percentiles of every traced phase
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.timings = {}  # (handler, phase) -> deque of ms
+        self.counts = {}
+        self.lock = threading.Lock()  # requests may finish on several threads
+
+    def add(self, record):
+        handler = record.get("handler")
+        with self.lock:
+            self.counts[handler] = self.counts.get(handler, 0) + 1
+            for name, ms in record.get("timings_ms", {}).items():
+                values = self.timings.get((handler, name))
+                if values is None:
+                    values = self.timings[(handler, name)] = deque(maxlen=self.window)
+                values.append(ms)
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+            timings = [(key, sorted(values)) for key, values in self.timings.items()]
+        result = {"requests": counts, "latency_ms": {}}
+        for (handler, name), ordered in timings:
+            result["latency_ms"].setdefault(handler, {})[name] = {
+                "p50": _percentile(ordered, 50), "p90": _percentile(ordered, 90),
+                "p99": _percentile(ordered, 99), "max": ordered[-1], "count": len(ordered),
+            }
+        return result
+
+
+def _percentile(ordered, q):
+    return ordered[max(0, -(-q * len(ordered) // 100) - 1)]
+
+
+METRICS = Metrics()
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def emit(record):
+    """
+    add a finished record to the metrics and write it out if TRACE is set
+    """
+    global _sink
+    METRICS.add(record)
+    if not TRACE:
+        return
+    line = json.dumps(record) + "\n"
+    with _sink_lock:
+        if _sink is None:
+            _sink = sys.stderr if TRACE == "-" else open(TRACE, "a")
+        _sink.write(line)
+        _sink.flush()
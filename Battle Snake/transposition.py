@@ -0,0 +1,81 @@
+from array import array
+
+# Transposition table for the Battle Snake search, keyed by GameState.hash.
+#
+# Slots live in flat arrays sized from max_bytes. A slot is overwritten when
+# it holds the same position, a result from an earlier turn's search, or a
+# result searched no deeper than the new one (depth-preferred replacement).
+# Results from earlier turns stay readable until they are overwritten, which
+# is what makes keeping the table in the game's session worthwhile.
+
+EXACT = 0
+LOWER = 1  # value is a lower bound (search failed high)
+UPPER = 2  # value is an upper bound (search failed low)
+ENTRY_BYTES = 20  # key 8, value 8, depth, move, flag and generation 1 each
+DEFAULT_BYTES = 4 * 1024 * 1024
+
+
+class TranspositionTable:
+    def __init__(self, max_bytes=DEFAULT_BYTES):
+        self.size = max(1, max_bytes // ENTRY_BYTES)
+        self.keys = array("Q", bytes(8 * self.size))
+        self.values = array("d", bytes(8 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.moves = array("b", bytes(self.size))  # index into DIRECTIONS, -1 for none
+        self.flags = array("B", bytes(self.size))
+        self.generations = array("B", bytes(self.size))  # 0 marks an empty slot
+        self.generation = 1
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.filled = 0
+
+    def new_search(self):
+        # entries from earlier searches stay readable but become replaceable
+        self.generation = self.generation % 255 + 1
+
+    def probe(self, key):
+        """
+        return (depth, value, move, flag), or None if the position is not
+        stored
+        """
+        self.probes += 1
+        i = key % self.size
+        if self.keys[i] != key or not self.generations[i]:
+            return None
+        self.hits += 1
+        return self.depths[i], self.values[i], self.moves[i], self.flags[i]
+
+    def store(self, key, depth, value, move, flag):
+        i = key % self.size
+        stored = self.generations[i]
+        if not stored:
+            self.filled += 1
+        elif self.keys[i] != key:
+            if stored == self.generation and self.depths[i] > depth:
+                return
+            self.overwrites += 1
+        self.keys[i] = key
+        self.values[i] = value
+        self.depths[i] = min(depth, 127)
+        self.moves[i] = move
+        self.flags[i] = flag
+        self.generations[i] = self.generation
+        self.stores += 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def memory_bytes(self):
+        return self.size * ENTRY_BYTES
+
+    def counters(self):
+        return {
+            "probes": self.probes, "hits": self.hits, "hit_rate": self.hit_rate(),
+            "stores": self.stores, "overwrites": self.overwrites,
+            "filled": self.filled, "size": self.size, "memory_bytes": self.memory_bytes(),
+        }
+
+    def clear(self):
+        self.__init__(self.size * ENTRY_BYTES)
@@ -0,0 +1,224 @@
+# Self-play tournament and benchmark harness for the Connect 4 AIs.
+#
+#   python connect4_bench.py minimax:5 random --games 200 --jobs 8 --output run.json
+#   python connect4_bench.py engine:200ms minimax:4 --baseline run.json
+#
+# Agents are "random", "greedy" (pick_best_move), "minimax:<depth>" (fixed
+# depth bitboard search) and "engine:<budget>ms" (Engine.best_move). Games are
+# played in parallel across processes, alternating which agent moves first.
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from connect4_engine import (ROWS, COLUMNS, PLAYER_PIECE, AI_PIECE, Engine, MoveOrdering, SearchStats, TranspositionTable,
+	bitboard_attach_evaluator, bitboard_copy, bitboard_drop_piece, bitboard_get_valid_locations,
+	bitboard_minimax, bitboard_swap_pieces, bitboard_winning_move, create_bitboard, create_board, drop_piece,
+	get_next_open_row, pick_best_move)
+
+class RandomAgent:
+	def __init__(self, rng):
+		self.rng = rng
+
+	def move(self, board, bb, piece, stats):
+		return self.rng.choice(bitboard_get_valid_locations(bb))
+
+class GreedyAgent:
+	def move(self, board, bb, piece, stats):
+		return pick_best_move(board, piece)
+
+class MinimaxAgent:
+	def __init__(self, depth):
+		self.depth = depth
+		self.table = TranspositionTable()
+		self.ordering = MoveOrdering()
+
+	def move(self, board, bb, piece, stats):
+		position = bitboard_swap_pieces(bb) if piece != AI_PIECE else bitboard_copy(bb)
+		bitboard_attach_evaluator(position)
+		self.table.new_search()
+		return bitboard_minimax(position, self.depth, -math.inf, math.inf, True, self.table, None, stats,
+			self.ordering)[0]
+
+class EngineAgent:
+	def __init__(self, budget_ms):
+		self.budget_ms = budget_ms
+		self.engine = Engine()
+
+	def move(self, board, bb, piece, stats):
+		col = self.engine.best_move(bb, self.budget_ms, piece)
+		stats.nodes += self.engine.last_stats.nodes
+		stats.cutoffs += self.engine.last_stats.cutoffs
+		stats.first_move_cutoffs += self.engine.last_stats.first_move_cutoffs
+		return col
+
+def make_agent(spec, rng):
+	name, _, arg = spec.partition(":")
+	if name == "random":
+		return RandomAgent(rng)
+	if name == "greedy":
+		return GreedyAgent()
+	if name == "minimax":
+		return MinimaxAgent(int(arg))
+	if name == "engine" and arg.endswith("ms"):
+		return EngineAgent(float(arg[:-2]))
+	raise ValueError("unknown agent %r" % spec)
+
+def play_game(specs, seed):
+	# Play one game between specs[0] (PLAYER_PIECE) and specs[1] (AI_PIECE).
+	# Agent 0 moves first in even-numbered games. Returns the winner's index
+	# (None for a draw) with each agent's per-move latencies and node counts.
+	rng = random.Random(seed)
+	random.seed(seed) # pick_best_move draws from the global generator
+	agents = [make_agent(spec, random.Random(rng.getrandbits(64))) for spec in specs]
+	pieces = (PLAYER_PIECE, AI_PIECE)
+	board = create_board()
+	bb = create_bitboard()
+	latencies = ([], [])
+	nodes = [0, 0]
+	cutoffs = [0, 0]
+	first_move_cutoffs = [0, 0]
+	search_seconds = [0.0, 0.0]
+	turn = seed % 2
+	winner = None
+	while bb.moves < ROWS*COLUMNS:
+		stats = SearchStats()
+		start = time.perf_counter()
+		col = agents[turn].move(board, bb, pieces[turn], stats)
+		elapsed = time.perf_counter() - start
+		latencies[turn].append(elapsed * 1000)
+		search_seconds[turn] += elapsed
+		nodes[turn] += stats.nodes
+		cutoffs[turn] += stats.cutoffs
+		first_move_cutoffs[turn] += stats.first_move_cutoffs
+
+		drop_piece(board, get_next_open_row(board, col), col, pieces[turn])
+		bitboard_drop_piece(bb, col, pieces[turn])
+		if bitboard_winning_move(bb, pieces[turn]):
+			winner = turn
+			break
+		turn = 1 - turn
+	return {"seed": seed, "winner": winner, "moves": bb.moves, "latencies_ms": latencies,
+		"nodes": nodes, "cutoffs": cutoffs, "first_move_cutoffs": first_move_cutoffs, "search_seconds": search_seconds}
+
+def wilson_interval(successes, n, z=1.96):
+	# 95% Wilson score interval for a binomial proportion
+	if n == 0:
+		return (0.0, 1.0)
+	p = successes / n
+	center = (p + z*z/(2*n)) / (1 + z*z/n)
+	half = z * math.sqrt(p*(1-p)/n + z*z/(4*n*n)) / (1 + z*z/n)
+	return (max(0.0, center - half), min(1.0, center + half))
+
+def summarize(specs, games):
+	n = len(games)
+	summary = {"games": n, "agents": []}
+	for i, spec in enumerate(specs):
+		latencies = [ms for game in games for ms in game["latencies_ms"][i]]
+		nodes = sum(game["nodes"][i] for game in games)
+		cutoffs = sum(game["cutoffs"][i] for game in games)
+		first_move_cutoffs = sum(game["first_move_cutoffs"][i] for game in games)
+		seconds = sum(game["search_seconds"][i] for game in games)
+		wins = sum(1 for game in games if game["winner"] == i)
+		draws = sum(1 for game in games if game["winner"] is None)
+		losses = n - wins - draws
+		summary["agents"].append({
+			"spec": spec,
+			"wins": wins,
+			"draws": draws,
+			"losses": losses,
+			"win_rate": wins / n if n else 0.0,
+			"win_rate_ci95": wilson_interval(wins, n),
+			"draw_rate_ci95": wilson_interval(draws, n),
+			"loss_rate_ci95": wilson_interval(losses, n),
+			"moves": len(latencies),
+			"nodes": nodes,
+			"nodes_per_second": nodes / seconds if seconds and nodes else None,
+			"cutoffs": cutoffs,
+			"first_move_cutoff_rate": first_move_cutoffs / cutoffs if cutoffs else None,
+			"latency_ms": {name: float(np.percentile(latencies, q)) if latencies else None
+				for name, q in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))},
+		})
+	summary["average_game_length"] = sum(game["moves"] for game in games) / n if n else 0.0
+	return summary
+
+def run_match(specs, games, jobs=None, seed=0):
+	seeds = [seed + i for i in range(games)]
+	if jobs == 1:
+		results = [play_game(specs, s) for s in seeds]
+	else:
+		with ProcessPoolExecutor(jobs) as executor:
+			results = list(executor.map(play_game, [specs]*games, seeds))
+	return summarize(specs, results)
+
+def find_regressions(baseline, current, tolerance):
+	# Compare two summaries of the same match and describe every agent that got
+	# slower or weaker by more than `tolerance` (a fraction)
+	regressions = []
+	for old, new in zip(baseline["agents"], current["agents"]):
+		spec = new["spec"]
+		if old["spec"] != spec:
+			regressions.append("agent %s was %s in the baseline" % (spec, old["spec"]))
+			continue
+		if old["nodes_per_second"] and new["nodes_per_second"] and \
+				new["nodes_per_second"] < old["nodes_per_second"] * (1 - tolerance):
+			regressions.append("%s nodes/s %.0f -> %.0f" % (spec, old["nodes_per_second"], new["nodes_per_second"]))
+		for name in ("p50", "p99"):
+			before, after = old["latency_ms"][name], new["latency_ms"][name]
+			if before and after and after > before * (1 + tolerance):
+				regressions.append("%s %s latency %.2fms -> %.2fms" % (spec, name, before, after))
+		# only flag strength changes the confidence intervals agree on
+		if new["win_rate_ci95"][1] < old["win_rate_ci95"][0]:
+			regressions.append("%s win rate %.3f -> %.3f" % (spec, old["win_rate"], new["win_rate"]))
+	return regressions
+
+def print_summary(summary):
+	print("%d games, %.1f moves per game" % (summary["games"], summary["average_game_length"]))
+	for agent in summary["agents"]:
+		low, high = agent["win_rate_ci95"]
+		latency = agent["latency_ms"]
+		nps = agent["nodes_per_second"]
+		print("  %-14s W/D/L %d/%d/%d  win %.3f [%.3f, %.3f]  latency p50 %.2fms p90 %.2fms p99 %.2fms  %s" % (
+			agent["spec"], agent["wins"], agent["draws"], agent["losses"], agent["win_rate"], low, high,
+			latency["p50"], latency["p90"], latency["p99"], "%.0f nodes/s" % nps if nps else "-"))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Play Connect 4 agents against each other and report speed and strength.")
+	parser.add_argument("agent_a")
+	parser.add_argument("agent_b")
+	parser.add_argument("--games", type=int, default=100)
+	parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="write the results as JSON to this file")
+	parser.add_argument("--baseline", help="JSON results of an earlier run to check for regressions")
+	parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown as a fraction (default 0.1)")
+	args = parser.parse_args(argv)
+
+	specs = [args.agent_a, args.agent_b]
+	for spec in specs:
+		make_agent(spec, random.Random())
+	summary = run_match(specs, args.games, args.jobs, args.seed)
+	summary["config"] = {"agents": specs, "games": args.games, "seed": args.seed}
+	print_summary(summary)
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump(summary, f, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = find_regressions(baseline, summary, args.tolerance)
+		for regression in regressions:
+			print("REGRESSION: " + regression)
+		if regressions:
+			return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,89 @@
+# Generate the Connect 4 opening book used by connect4_engine.Engine.
+#
+#   python connect4_book.py --ply 4 --depth 10 --output connect4.book
+#
+# Every position with at most --ply pieces in which the AI is to move (with
+# either side having started) is searched to --depth across a process pool.
+# Mirror images are stored once, under their canonical key.
+
+import argparse
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from connect4_engine import (PLAYER_PIECE, AI_PIECE, TranspositionTable, bitboard_attach_evaluator,
+	bitboard_copy, bitboard_drop_piece, bitboard_get_valid_locations, bitboard_minimax, bitboard_winning_move,
+	canonical_key, create_bitboard, write_opening_book, BB_HEIGHT, COLUMNS)
+
+def _mirror(bb):
+	mirrored = create_bitboard()
+	for col in range(COLUMNS):
+		for bit in range(col*BB_HEIGHT, bb.heights[col]):
+			piece = AI_PIECE if bb.pieces[AI_PIECE] >> bit & 1 else PLAYER_PIECE
+			bitboard_drop_piece(mirrored, COLUMNS-1-col, piece)
+	return mirrored
+
+def book_positions(ply):
+	# Canonical key -> BitBoard in canonical orientation for each position, up
+	# to `ply` pieces, that has the AI to move and no four in a row yet
+	positions = {}
+	for first in (AI_PIECE, PLAYER_PIECE):
+		frontier = [create_bitboard()]
+		for moves in range(ply+1):
+			to_move = first if moves % 2 == 0 else AI_PIECE + PLAYER_PIECE - first
+			if to_move == AI_PIECE:
+				for bb in frontier:
+					positions.setdefault(canonical_key(bb)[0], bb)
+			if moves == ply:
+				break
+			next_frontier = {}
+			for bb in frontier:
+				for col in bitboard_get_valid_locations(bb):
+					child = bitboard_copy(bb)
+					bitboard_drop_piece(child, col, to_move)
+					if bitboard_winning_move(child, to_move):
+						continue
+					key, mirrored = canonical_key(child)
+					if key not in next_frontier:
+						next_frontier[key] = _mirror(child) if mirrored else child
+			frontier = list(next_frontier.values())
+	return positions
+
+_worker_table = None # one transposition table per worker process
+
+def _search_position(args):
+	global _worker_table
+	key, bb, depth = args
+	if _worker_table is None:
+		_worker_table = TranspositionTable()
+	_worker_table.new_search()
+	bitboard_attach_evaluator(bb)
+	col, score = bitboard_minimax(bb, depth, -math.inf, math.inf, True, _worker_table)
+	return key, col, score
+
+def generate_book(path, ply, depth, jobs=None):
+	positions = book_positions(ply)
+	entries = {}
+	tasks = [(key, bb, depth) for key, bb in positions.items()]
+	with ProcessPoolExecutor(jobs) as executor:
+		for key, col, score in executor.map(_search_position, tasks, chunksize=4):
+			entries[key] = (col, score)
+	write_opening_book(path, entries, ply, depth)
+	return len(entries)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Build the Connect 4 opening book by deep search.")
+	parser.add_argument("--ply", type=int, default=4, help="store positions with at most this many pieces")
+	parser.add_argument("--depth", type=int, default=10, help="search depth for each position")
+	parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+	parser.add_argument("--output", default="connect4.book")
+	args = parser.parse_args(argv)
+
+	start = time.perf_counter()
+	count = generate_book(args.output, args.ply, args.depth, args.jobs)
+	print("Wrote %d positions to %s in %.1fs" % (count, args.output, time.perf_counter() - start))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
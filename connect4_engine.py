@@ -0,0 +1,971 @@
+# Connect 4 board logic and AI search, importable without pygame or a display.
+# connect4.py is the pygame client on top of this module.
+
+import numpy as np
+import random
+import math
+import mmap
+import multiprocessing
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from array import array
+
+ROWS = 6
+COLUMNS = 7
+
+PLAYER = 0
+AI = 1
+
+EMPTY = 0
+PLAYER_PIECE = 1
+AI_PIECE = 2
+
+WINDOW_LENGTH = 4
+
+ENDGAME_CELLS = 20 # at most this many empty cells, the engine solves the game exactly
+
+
+def create_board():
+	board = np.zeros((ROWS,COLUMNS))
+	return board
+
+def drop_piece(board, row, col, piece):
+	board[row][col] = piece
+
+def is_valid_location(board, col):
+	return board[ROWS-1][col] == 0
+
+def get_next_open_row(board, col):
+	for r in range(ROWS):
+		if board[r][col] == 0:
+			return r
+
+def print_board(board):
+	print(np.flip(board, 0))
+
+def winning_move(board, piece):
+	# Check horizontal locations for win
+	for c in range(COLUMNS-3):
+		for r in range(ROWS):
+			if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
+				return True
+
+	# Check vertical locations for win
+	for c in range(COLUMNS):
+		for r in range(ROWS-3):
+			if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
+				return True
+
+	# Check positively sloped diaganols
+	for c in range(COLUMNS-3):
+		for r in range(ROWS-3):
+			if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
+				return True
+
+	# Check negatively sloped diaganols
+	for c in range(COLUMNS-3):
+		for r in range(3, ROWS):
+			if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
+				return True
+
+def evaluate_window(window, piece):
+	score = 0
+	opp_piece = PLAYER_PIECE
+	if piece == PLAYER_PIECE:
+		opp_piece = AI_PIECE
+
+	if window.count(piece) == 4:
+		score += 100
+	elif window.count(piece) == 3 and window.count(EMPTY) == 1:
+		score += 5
+	elif window.count(piece) == 2 and window.count(EMPTY) == 2:
+		score += 2
+
+	if window.count(opp_piece) == 3 and window.count(EMPTY) == 1:
+		score -= 4
+
+	return score
+
+def _window_indices():
+	# Flat board indices of the cells in each of the 69 four-cell windows
+	windows = []
+	for r in range(ROWS):
+		for c in range(COLUMNS-3):
+			windows.append([r*COLUMNS + c+i for i in range(WINDOW_LENGTH)])
+	for c in range(COLUMNS):
+		for r in range(ROWS-3):
+			windows.append([(r+i)*COLUMNS + c for i in range(WINDOW_LENGTH)])
+	for r in range(ROWS-3):
+		for c in range(COLUMNS-3):
+			windows.append([(r+i)*COLUMNS + c+i for i in range(WINDOW_LENGTH)])
+	for r in range(ROWS-3):
+		for c in range(COLUMNS-3):
+			windows.append([(r+3-i)*COLUMNS + c+i for i in range(WINDOW_LENGTH)])
+	return np.array(windows)
+
+WINDOW_INDICES = _window_indices()
+
+# WINDOW_SCORE_TABLE[own, opp] is evaluate_window() for a window holding `own`
+# of the scored piece and `opp` of the opponent's
+WINDOW_SCORE_TABLE = np.array([[evaluate_window([PLAYER_PIECE]*own + [AI_PIECE]*opp + [EMPTY]*(WINDOW_LENGTH-own-opp), PLAYER_PIECE)
+	if own + opp <= WINDOW_LENGTH else 0 for opp in range(WINDOW_LENGTH+1)] for own in range(WINDOW_LENGTH+1)])
+
+def score_positions(boards, piece):
+	# score_position() for a stack of boards of shape (n, ROWS, COLUMNS) at once
+	opp_piece = PLAYER_PIECE
+	if piece == PLAYER_PIECE:
+		opp_piece = AI_PIECE
+
+	boards = np.asarray(boards)
+	windows = boards.reshape(len(boards), -1)[:, WINDOW_INDICES]
+	own = np.count_nonzero(windows == piece, axis=2)
+	opp = np.count_nonzero(windows == opp_piece, axis=2)
+	center_count = np.count_nonzero(boards[:, :, COLUMNS//2] == piece, axis=1)
+	return center_count * 3 + WINDOW_SCORE_TABLE[own, opp].sum(axis=1)
+
+def score_position(board, piece):
+	return int(score_positions(board[np.newaxis], piece)[0])
+
+def is_terminal_node(board):
+	return winning_move(board, PLAYER_PIECE) or winning_move(board, AI_PIECE) or len(get_valid_locations(board)) == 0
+
+def minimax(board, depth, alpha, beta, maximizingPlayer):
+	valid_locations = get_valid_locations(board)
+	is_terminal = is_terminal_node(board)
+	if depth == 0 or is_terminal:
+		if is_terminal:
+			if winning_move(board, AI_PIECE):
+				return (None, 100000000000000)
+			elif winning_move(board, PLAYER_PIECE):
+				return (None, -10000000000000)
+			else: # Game is over, no more valid moves
+				return (None, 0)
+		else: # Depth is zero
+			return (None, score_position(board, AI_PIECE))
+	if maximizingPlayer:
+		value = -math.inf
+		column = valid_locations[0]
+		for col in valid_locations:
+			row = get_next_open_row(board, col)
+			b_copy = board.copy()
+			drop_piece(b_copy, row, col, AI_PIECE)
+			new_score = minimax(b_copy, depth-1, alpha, beta, False)[1]
+			if new_score > value:
+				value = new_score
+				column = col
+			alpha = max(alpha, value)
+			if alpha >= beta:
+				break
+		return column, value
+
+	else: # Minimizing player
+		value = math.inf
+		column = valid_locations[0]
+		for col in valid_locations:
+			row = get_next_open_row(board, col)
+			b_copy = board.copy()
+			drop_piece(b_copy, row, col, PLAYER_PIECE)
+			new_score = minimax(b_copy, depth-1, alpha, beta, True)[1]
+			if new_score < value:
+				value = new_score
+				column = col
+			beta = min(beta, value)
+			if alpha >= beta:
+				break
+		return column, value
+
+def get_valid_locations(board):
+	valid_locations = []
+	for col in range(COLUMNS):
+		if is_valid_location(board, col):
+			valid_locations.append(col)
+	return valid_locations
+
+def pick_best_move(board, piece):
+
+	valid_locations = get_valid_locations(board)
+	children = np.repeat(board[np.newaxis], len(valid_locations), axis=0)
+	for child, col in zip(children, valid_locations):
+		drop_piece(child, get_next_open_row(board, col), col, piece)
+	scores = score_positions(children, piece)
+	best_col = random.choice(valid_locations)
+	if scores.max() > -10000:
+		best_col = valid_locations[int(np.argmax(scores))]
+
+	return best_col
+
+# Bitboard representation: each column takes ROWS+1 bits (one sentinel bit on
+# top), so bit index col*(ROWS+1) + row is cell (row, col). One integer mask is
+# kept per piece and moves are applied and undone in place.
+BB_HEIGHT = ROWS + 1
+BB_WIN_SHIFTS = (1, BB_HEIGHT, BB_HEIGHT-1, BB_HEIGHT+1) # vertical, horizontal, both diagonals
+BB_CENTER_MASK = sum(1 << ((COLUMNS//2)*BB_HEIGHT + r) for r in range(ROWS))
+
+# For scoring, each piece also has a "lanes" mask holding the board four times,
+# once per window direction, laid out so that the cells of every window are
+# consecutive bits. All 69 windows are then counted with a single set of shifts.
+LANE_BITS = 128
+LANE_GROUP = 8 # bits per row/column/diagonal within a lane, at least COLUMNS+1
+
+def _lane_bits(r, c):
+	# Bit offsets of cell (r, c) in the vertical, horizontal, / and \ lanes
+	return (c*LANE_GROUP + r,
+		LANE_BITS + r*LANE_GROUP + c,
+		2*LANE_BITS + (c - r + ROWS-1)*LANE_GROUP + r,
+		3*LANE_BITS + (c + r)*LANE_GROUP + c)
+
+def _lane_tables():
+	cells = [0] * (COLUMNS*BB_HEIGHT)
+	starts = 0
+	for c in range(COLUMNS):
+		for r in range(ROWS):
+			lanes = _lane_bits(r, c)
+			cells[c*BB_HEIGHT + r] = sum(1 << b for b in lanes)
+			# a window starts at (r, c) in a direction if its last cell is on the board
+			for (dr, dc), bit in zip(((1, 0), (0, 1), (1, 1), (-1, 1)), lanes):
+				end_r, end_c = r + dr*(WINDOW_LENGTH-1), c + dc*(WINDOW_LENGTH-1)
+				if 0 <= end_r < ROWS and end_c < COLUMNS:
+					starts |= 1 << bit
+	return cells, starts
+
+BB_CELL_LANES, BB_WINDOW_STARTS = _lane_tables()
+
+# evaluate_window() only scores windows holding pieces of a single colour, so
+# these give its value by the number of own (or opponent) pieces in the window
+OWN_WINDOW_SCORES = [evaluate_window([PLAYER_PIECE]*n + [EMPTY]*(WINDOW_LENGTH-n), PLAYER_PIECE) for n in range(WINDOW_LENGTH+1)]
+OPP_WINDOW_SCORES = [evaluate_window([AI_PIECE]*n + [EMPTY]*(WINDOW_LENGTH-n), PLAYER_PIECE) for n in range(WINDOW_LENGTH+1)]
+
+# Zobrist keys: one random 64-bit number per (piece, cell), XORed into the
+# position hash as pieces are dropped and removed
+_zobrist_random = random.Random(20240)
+ZOBRIST = [[_zobrist_random.getrandbits(64) for bit in range(COLUMNS*BB_HEIGHT)] for piece in range(3)]
+ZOBRIST_AI_TO_MOVE = _zobrist_random.getrandbits(64)
+
+class BitBoard:
+	__slots__ = ("pieces", "lanes", "heights", "moves", "hash", "evaluator")
+
+	def __init__(self):
+		self.pieces = [0, 0, 0] # indexed by piece, EMPTY slot unused
+		self.lanes = [0, 0, 0]
+		self.heights = [c*BB_HEIGHT for c in range(COLUMNS)] # next free bit per column
+		self.moves = 0
+		self.hash = 0
+		self.evaluator = None # optional IncrementalEvaluator kept in step with the pieces
+
+def create_bitboard():
+	return BitBoard()
+
+def bitboard_from_board(board):
+	bb = create_bitboard()
+	for c in range(COLUMNS):
+		for r in range(ROWS):
+			piece = int(board[r][c])
+			if piece == EMPTY:
+				break
+			bitboard_drop_piece(bb, c, piece)
+	return bb
+
+def bitboard_copy(bb):
+	copy = BitBoard()
+	copy.pieces = bb.pieces[:]
+	copy.lanes = bb.lanes[:]
+	copy.heights = bb.heights[:]
+	copy.moves = bb.moves
+	copy.hash = bb.hash
+	if bb.evaluator is not None:
+		copy.evaluator = bb.evaluator.copy()
+	return copy
+
+def bitboard_drop_piece(bb, col, piece):
+	bit = bb.heights[col]
+	bb.pieces[piece] |= 1 << bit
+	bb.lanes[piece] |= BB_CELL_LANES[bit]
+	bb.heights[col] = bit + 1
+	bb.moves += 1
+	bb.hash ^= ZOBRIST[piece][bit]
+	if bb.evaluator is not None:
+		bb.evaluator.make(bit, piece)
+
+def bitboard_undo_piece(bb, col, piece):
+	bit = bb.heights[col] - 1
+	bb.pieces[piece] ^= 1 << bit
+	bb.lanes[piece] ^= BB_CELL_LANES[bit]
+	bb.heights[col] = bit
+	bb.moves -= 1
+	bb.hash ^= ZOBRIST[piece][bit]
+	if bb.evaluator is not None:
+		bb.evaluator.undo(bit, piece)
+
+def bitboard_is_valid_location(bb, col):
+	return bb.heights[col] < col*BB_HEIGHT + ROWS
+
+def bitboard_get_valid_locations(bb):
+	return [col for col in range(COLUMNS) if bb.heights[col] < col*BB_HEIGHT + ROWS]
+
+def bitboard_winning_move(bb, piece):
+	mask = bb.pieces[piece]
+	for shift in BB_WIN_SHIFTS:
+		m = mask & (mask >> shift)
+		if m & (m >> 2*shift):
+			return True
+	return False
+
+def bitboard_score_position(bb, piece):
+	# Same result as score_position(). The pieces in every window are counted at
+	# once with a bit-sliced adder over the shifted lane masks.
+	own = bb.lanes[piece]
+	opp = bb.lanes[AI_PIECE if piece == PLAYER_PIECE else PLAYER_PIECE]
+	a1, a2, a3 = own >> 1, own >> 2, own >> 3
+	b1, b2, b3 = opp >> 1, opp >> 2, opp >> 3
+	own_only = BB_WINDOW_STARTS & ~(opp | b1 | b2 | b3)
+	opp_only = BB_WINDOW_STARTS & ~(own | a1 | a2 | a3)
+	s0, c0, s1, c1 = own ^ a1, own & a1, a2 ^ a3, a2 & a3
+	low, mid = s0 ^ s1, c0 ^ c1 ^ (s0 & s1)
+	score = (bb.pieces[piece] & BB_CENTER_MASK).bit_count() * 3
+	score += OWN_WINDOW_SCORES[4] * (c0 & c1 & BB_WINDOW_STARTS).bit_count()
+	score += OWN_WINDOW_SCORES[3] * (mid & low & own_only).bit_count()
+	score += OWN_WINDOW_SCORES[2] * (mid & ~low & own_only).bit_count()
+	s0, c0, s1, c1 = opp ^ b1, opp & b1, b2 ^ b3, b2 & b3
+	score += OPP_WINDOW_SCORES[3] * ((c0 ^ c1 ^ (s0 & s1)) & (s0 ^ s1) & opp_only).bit_count()
+	return score
+
+def _evaluator_tables():
+	# Windows through each bitboard cell, and the score change of adding a piece
+	# to a window by its state code (own count + 5 * opponent count)
+	cell_windows = [[] for bit in range(COLUMNS*BB_HEIGHT)]
+	for w, window in enumerate(WINDOW_INDICES.tolist()):
+		for i in window:
+			r, c = divmod(i, COLUMNS)
+			cell_windows[c*BB_HEIGHT + r].append(w)
+	base = WINDOW_LENGTH + 1
+	def code_score(code):
+		own, opp = code % base, code // base
+		return int(WINDOW_SCORE_TABLE[own, opp]) if own + opp <= WINDOW_LENGTH else 0
+	own_delta = [code_score(code + 1) - code_score(code) for code in range(base*base)]
+	opp_delta = [code_score(code + base) - code_score(code) for code in range(base*base - base)]
+	return cell_windows, base, own_delta, opp_delta
+
+EVAL_CELL_WINDOWS, EVAL_OPP_STEP, EVAL_OWN_DELTA, EVAL_OPP_DELTA = _evaluator_tables()
+EVAL_CENTER_CELLS = frozenset((COLUMNS//2)*BB_HEIGHT + r for r in range(ROWS))
+
+class IncrementalEvaluator:
+	"""Running score_position() of one piece, updated as pieces are added and removed.
+
+	Each window keeps its piece counts as a state code, so a move only touches
+	the windows through its cell (at most 13) and `score` is always current.
+	"""
+
+	__slots__ = ("piece", "codes", "score")
+
+	def __init__(self, piece=AI_PIECE):
+		self.piece = piece
+		self.codes = [0] * len(WINDOW_INDICES)
+		self.score = 0
+
+	def copy(self):
+		copy = IncrementalEvaluator(self.piece)
+		copy.codes = self.codes[:]
+		copy.score = self.score
+		return copy
+
+	def make(self, bit, piece):
+		codes = self.codes
+		score = self.score
+		if piece == self.piece:
+			if bit in EVAL_CENTER_CELLS:
+				score += 3
+			for w in EVAL_CELL_WINDOWS[bit]:
+				code = codes[w]
+				score += EVAL_OWN_DELTA[code]
+				codes[w] = code + 1
+		else:
+			for w in EVAL_CELL_WINDOWS[bit]:
+				code = codes[w]
+				score += EVAL_OPP_DELTA[code]
+				codes[w] = code + EVAL_OPP_STEP
+		self.score = score
+
+	def score_after(self, bit, piece):
+		# The score make(bit, piece) would give, without changing the state
+		codes = self.codes
+		score = self.score
+		if piece == self.piece:
+			if bit in EVAL_CENTER_CELLS:
+				score += 3
+			for w in EVAL_CELL_WINDOWS[bit]:
+				score += EVAL_OWN_DELTA[codes[w]]
+		else:
+			for w in EVAL_CELL_WINDOWS[bit]:
+				score += EVAL_OPP_DELTA[codes[w]]
+		return score
+
+	def undo(self, bit, piece):
+		codes = self.codes
+		score = self.score
+		if piece == self.piece:
+			if bit in EVAL_CENTER_CELLS:
+				score -= 3
+			for w in EVAL_CELL_WINDOWS[bit]:
+				code = codes[w] - 1
+				score -= EVAL_OWN_DELTA[code]
+				codes[w] = code
+		else:
+			for w in EVAL_CELL_WINDOWS[bit]:
+				code = codes[w] - EVAL_OPP_STEP
+				score -= EVAL_OPP_DELTA[code]
+				codes[w] = code
+		self.score = score
+
+def bitboard_attach_evaluator(bb, piece=AI_PIECE):
+	# Start keeping an IncrementalEvaluator for the pieces already on bb
+	evaluator = IncrementalEvaluator(piece)
+	for p in (PLAYER_PIECE, AI_PIECE):
+		mask = bb.pieces[p]
+		for bit in range(COLUMNS*BB_HEIGHT):
+			if mask >> bit & 1:
+				evaluator.make(bit, p)
+	bb.evaluator = evaluator
+	return evaluator
+
+TT_EXACT = 0
+TT_LOWER = 1 # score is a lower bound (search failed high)
+TT_UPPER = 2 # score is an upper bound (search failed low)
+TT_ENTRY_BYTES = 20 # key 8, score 8, depth, move, flag and generation 1 each
+
+class TranspositionTable:
+	"""Fixed-size table of search results keyed by Zobrist hash.
+
+	Slots are kept in flat arrays sized from max_bytes. A slot is overwritten
+	when it holds the same position, a result from an earlier search, or a
+	result searched no deeper than the new one (depth-preferred replacement).
+	"""
+
+	def __init__(self, max_bytes=16*1024*1024):
+		self.size = max(1, max_bytes // TT_ENTRY_BYTES)
+		self.keys = array('Q', bytes(8*self.size))
+		self.scores = array('q', bytes(8*self.size))
+		self.depths = array('b', bytes(self.size))
+		self.moves = array('b', bytes(self.size))
+		self.flags = array('B', bytes(self.size))
+		self.generations = array('B', bytes(self.size)) # 0 marks an empty slot
+		self.generation = 1
+		self.probes = 0
+		self.hits = 0
+		self.stores = 0
+		self.overwrites = 0
+
+	def new_search(self):
+		# Entries from earlier searches stay readable but become replaceable
+		self.generation = self.generation % 255 + 1
+
+	def probe(self, key):
+		# Returns (depth, score, move, flag), or None if the position is not stored
+		self.probes += 1
+		i = key % self.size
+		if self.keys[i] != key or not self.generations[i]:
+			return None
+		self.hits += 1
+		move = self.moves[i]
+		return self.depths[i], self.scores[i], (None if move < 0 else move), self.flags[i]
+
+	def store(self, key, depth, score, move, flag):
+		i = key % self.size
+		stored = self.generations[i]
+		if stored and self.keys[i] != key:
+			if stored == self.generation and self.depths[i] > depth:
+				return
+			self.overwrites += 1
+		self.keys[i] = key
+		self.scores[i] = score
+		self.depths[i] = depth
+		self.moves[i] = -1 if move is None else move
+		self.flags[i] = flag
+		self.generations[i] = self.generation
+		self.stores += 1
+
+	def hit_rate(self):
+		return self.hits / self.probes if self.probes else 0.0
+
+	def clear(self):
+		self.__init__(self.size * TT_ENTRY_BYTES)
+
+class SearchTimeout(Exception):
+	pass
+
+class SearchStats:
+	# Counters filled in by a search that is passed one
+	__slots__ = ("nodes", "cutoffs", "first_move_cutoffs")
+
+	def __init__(self):
+		self.nodes = 0 # positions visited, including leaves and the root
+		self.cutoffs = 0 # nodes whose search stopped early on an alpha-beta cutoff
+		self.first_move_cutoffs = 0 # ... because of the first column they tried
+
+class MoveOrdering:
+	"""Order in which the search tries columns, and what it learns about them.
+
+	Columns are tried center-first (or left to right), with ties between
+	columns broken by a random order drawn from `seed` (or left to right when
+	seed is None). History scores, from cutoffs anywhere in the tree, reorder
+	them at nodes more than one ply from the leaves. The two killer columns
+	of the current ply, then the transposition table's best column, go first.
+	"""
+
+	def __init__(self, center_first=True, tt_move=True, killers=True, history=True, seed=None):
+		tiebreak = list(range(COLUMNS))
+		if seed is not None:
+			random.Random(seed).shuffle(tiebreak)
+		if center_first:
+			self.columns = sorted(range(COLUMNS), key=lambda col: (abs(col - COLUMNS//2), tiebreak[col]))
+		else:
+			self.columns = sorted(range(COLUMNS), key=lambda col: tiebreak[col])
+		self.use_tt_move = tt_move
+		self.use_killers = killers
+		self.use_history = history
+		self.clear()
+
+	def clear(self):
+		self.killers = [[None, None] for ply in range(ROWS*COLUMNS + 1)]
+		self.history = [[0] * (COLUMNS*BB_HEIGHT) for piece in range(3)] # by piece and cell
+
+	def order(self, bb, piece, depth, tt_move):
+		order = self.columns
+		if self.use_history and depth > 1:
+			history = self.history[piece]
+			heights = bb.heights
+			order = sorted(order, key=lambda col: -history[heights[col]])
+		if self.use_killers:
+			first, second = self.killers[bb.moves]
+			if second is not None:
+				order = [second] + [col for col in order if col != second]
+			if first is not None:
+				order = [first] + [col for col in order if col != first]
+		if self.use_tt_move and tt_move is not None:
+			order = [tt_move] + [col for col in order if col != tt_move]
+		return order
+
+	def cutoff(self, bb, piece, col, depth):
+		# `piece` dropping in `col` caused a cutoff in position bb
+		killers = self.killers[bb.moves]
+		if killers[0] != col:
+			killers[1] = killers[0]
+			killers[0] = col
+		self.history[piece][bb.heights[col]] += depth * depth
+
+def bitboard_minimax(bb, depth, alpha, beta, maximizingPlayer, table=None, deadline=None, stats=None, ordering=None):
+	# Same search and scores as minimax(), on a BitBoard that is updated in place.
+	# With a TranspositionTable, stored results narrow the alpha-beta window and
+	# the stored best column is searched first. A MoveOrdering replaces the
+	# default left-to-right order. Past the time.perf_counter() deadline
+	# SearchTimeout is raised and bb is left mid-search.
+	if stats is not None:
+		stats.nodes += 1
+	if bitboard_winning_move(bb, AI_PIECE):
+		return (None, 100000000000000)
+	if bitboard_winning_move(bb, PLAYER_PIECE):
+		return (None, -10000000000000)
+	if bb.moves == ROWS*COLUMNS:
+		return (None, 0)
+	if depth == 0:
+		if bb.evaluator is not None and bb.evaluator.piece == AI_PIECE:
+			return (None, bb.evaluator.score)
+		return (None, bitboard_score_position(bb, AI_PIECE))
+	return _bitboard_search(bb, depth, alpha, beta, maximizingPlayer, table, deadline, stats, ordering)
+
+def _bitboard_search(bb, depth, alpha, beta, maximizingPlayer, table, deadline, stats, ordering):
+	# Children are scored here rather than by recursing into them when they are
+	# won, drawn or at depth 0. Only the side that just moved can have won.
+	if deadline is not None and depth > 1 and time.perf_counter() > deadline:
+		raise SearchTimeout
+	piece = AI_PIECE if maximizingPlayer else PLAYER_PIECE
+	tt_move = None
+	if table is not None:
+		key = bb.hash ^ ZOBRIST_AI_TO_MOVE if maximizingPlayer else bb.hash
+		entry = table.probe(key)
+		if entry is not None:
+			entry_depth, entry_score, tt_move, entry_flag = entry
+			if entry_depth >= depth:
+				if entry_flag == TT_EXACT:
+					return tt_move, entry_score
+				if entry_flag == TT_LOWER and entry_score >= beta:
+					return tt_move, entry_score
+				if entry_flag == TT_UPPER and entry_score <= alpha:
+					return tt_move, entry_score
+		alpha_orig, beta_orig = alpha, beta
+	if ordering is not None:
+		order = ordering.order(bb, piece, depth, tt_move)
+	elif tt_move is not None:
+		order = [tt_move] + [col for col in range(COLUMNS) if col != tt_move]
+	else:
+		order = range(COLUMNS)
+	win_score = 100000000000000 if maximizingPlayer else -10000000000000
+	last_move = bb.moves + 1 == ROWS*COLUMNS
+	pieces = bb.pieces
+	lanes = bb.lanes
+	heights = bb.heights
+	zobrist = ZOBRIST[piece]
+	evaluator = bb.evaluator
+	if evaluator is not None and evaluator.piece != AI_PIECE:
+		evaluator = None
+	column = None
+	value = -math.inf if maximizingPlayer else math.inf
+	tried = 0
+	for col in order:
+		height = heights[col]
+		if height >= col*BB_HEIGHT + ROWS:
+			continue
+		tried += 1
+		if stats is not None:
+			stats.nodes += 1
+		# lanes are separated by empty bits, so one test covers all four directions
+		mask = lanes[piece] | BB_CELL_LANES[height]
+		mask &= mask >> 1
+		if mask & (mask >> 2):
+			new_score = win_score
+		elif last_move:
+			new_score = 0
+		elif depth == 1 and evaluator is not None:
+			new_score = evaluator.score_after(height, piece)
+		else:
+			# bitboard_drop_piece() / bitboard_undo_piece(), inlined
+			pieces[piece] ^= 1 << height
+			lanes[piece] ^= BB_CELL_LANES[height]
+			heights[col] = height + 1
+			bb.moves += 1
+			bb.hash ^= zobrist[height]
+			if evaluator is not None:
+				evaluator.make(height, piece)
+				new_score = _bitboard_search(bb, depth-1, alpha, beta, not maximizingPlayer, table, deadline, stats, ordering)[1]
+				evaluator.undo(height, piece)
+			elif depth == 1:
+				new_score = bitboard_score_position(bb, AI_PIECE)
+			else:
+				new_score = _bitboard_search(bb, depth-1, alpha, beta, not maximizingPlayer, table, deadline, stats, ordering)[1]
+			pieces[piece] ^= 1 << height
+			lanes[piece] ^= BB_CELL_LANES[height]
+			heights[col] = height
+			bb.moves -= 1
+			bb.hash ^= zobrist[height]
+		if maximizingPlayer:
+			if new_score > value:
+				value = new_score
+				column = col
+			if value > alpha:
+				alpha = value
+		else:
+			if new_score < value:
+				value = new_score
+				column = col
+			if value < beta:
+				beta = value
+		if alpha >= beta:
+			if ordering is not None:
+				ordering.cutoff(bb, piece, col, depth)
+			if stats is not None:
+				stats.cutoffs += 1
+				if tried == 1:
+					stats.first_move_cutoffs += 1
+			break
+
+	if table is not None:
+		if value <= alpha_orig:
+			flag = TT_UPPER
+		elif value >= beta_orig:
+			flag = TT_LOWER
+		else:
+			flag = TT_EXACT
+		table.store(key, depth, value, column, flag)
+	return column, value
+
+def iterative_deepening(bb, budget_ms, table=None, max_depth=None, stats=None, ordering=None):
+	# Search the AI move at depth 1, 2, 3, ... until budget_ms has passed and
+	# return (column, score, depth) from the deepest search that finished. Each
+	# depth stores its best columns in the table, so the next depth tries them
+	# first. Depth 1 always finishes; the search stops early once the rest of
+	# the game has been searched or a forced win or loss is found. Columns are
+	# ordered by a fresh MoveOrdering unless one is given.
+	deadline = time.perf_counter() + budget_ms / 1000
+	if table is None:
+		table = TranspositionTable()
+	if ordering is None:
+		ordering = MoveOrdering()
+	table.new_search()
+	empty_cells = ROWS*COLUMNS - bb.moves
+	if max_depth is None or max_depth > empty_cells:
+		max_depth = empty_cells
+	bb = bitboard_copy(bb)
+	if bb.evaluator is None:
+		bitboard_attach_evaluator(bb)
+	column, score, completed = None, None, 0
+	for depth in range(1, max_depth+1):
+		try:
+			column, score = bitboard_minimax(bitboard_copy(bb), depth, -math.inf, math.inf, True, table,
+				deadline if depth > 1 else None, stats, ordering)
+		except SearchTimeout:
+			break
+		completed = depth
+		if abs(score) >= 10000000000000 or time.perf_counter() >= deadline:
+			break
+	return column, score, completed
+
+# State of a ParallelSearch worker process, set up by _init_search_worker
+_worker_alpha = None
+_worker_table = None
+_worker_ordering = None
+
+def _init_search_worker(shared_alpha, table_bytes):
+	global _worker_alpha, _worker_table, _worker_ordering
+	_worker_alpha = shared_alpha
+	_worker_table = TranspositionTable(table_bytes)
+	_worker_ordering = MoveOrdering()
+
+def _search_root_column(bb, col, depth, deadline):
+	# Score the AI move `col` at `depth` in a worker. The window starts just
+	# below the best score found so far by any worker, so the result is exact
+	# whenever it could be the best (or tied best) column. Returns (col, score,
+	# nodes), with None for the score if the deadline passed.
+	alpha = _worker_alpha.value
+	stats = SearchStats()
+	bitboard_drop_piece(bb, col, AI_PIECE)
+	try:
+		score = bitboard_minimax(bb, depth-1, alpha-1, math.inf, False, _worker_table, deadline, stats,
+			_worker_ordering)[1]
+	except SearchTimeout:
+		return col, None, stats.nodes
+	with _worker_alpha.get_lock():
+		if score > _worker_alpha.value:
+			_worker_alpha.value = score
+	return col, score, stats.nodes
+
+class ParallelSearch:
+	"""Root-split AI search over a pool of worker processes.
+
+	Each valid AI column is searched by a worker with its own transposition
+	table. The best score found so far is shared between workers through a
+	multiprocessing.Value and used as alpha by every column searched after it.
+	best_move() returns the same column and score as
+	bitboard_minimax(bb, depth, -math.inf, math.inf, True).
+	"""
+
+	def __init__(self, workers=None, table_bytes=16*1024*1024):
+		self.workers = workers or multiprocessing.cpu_count()
+		self.alpha = multiprocessing.Value('d', -math.inf)
+		self.executor = ProcessPoolExecutor(self.workers, initializer=_init_search_worker,
+			initargs=(self.alpha, table_bytes))
+
+	def close(self):
+		self.executor.shutdown(cancel_futures=True)
+
+	def best_move(self, bb, depth, deadline=None, first_col=None, stats=None):
+		# Returns (column, score), or raises SearchTimeout if the deadline passed
+		if stats is not None:
+			stats.nodes += 1
+		if bitboard_winning_move(bb, AI_PIECE):
+			return (None, 100000000000000)
+		if bitboard_winning_move(bb, PLAYER_PIECE):
+			return (None, -10000000000000)
+		if bb.moves == ROWS*COLUMNS:
+			return (None, 0)
+		if depth == 0:
+			return (None, bitboard_score_position(bb, AI_PIECE))
+
+		valid_locations = bitboard_get_valid_locations(bb)
+		# searching the expected best column first raises the shared alpha early
+		if first_col in valid_locations:
+			valid_locations.remove(first_col)
+			valid_locations.insert(0, first_col)
+		self.alpha.value = -math.inf
+		futures = [self.executor.submit(_search_root_column, bb, col, depth, deadline) for col in valid_locations]
+		scores = {}
+		for future in as_completed(futures):
+			col, score, nodes = future.result()
+			if stats is not None:
+				stats.nodes += nodes
+			if score is None:
+				for f in futures:
+					f.cancel()
+				raise SearchTimeout
+			scores[col] = score
+
+		column, value = None, -math.inf
+		for col in sorted(scores):
+			if scores[col] > value:
+				column, value = col, scores[col]
+		return column, value
+
+	def iterative_deepening(self, bb, budget_ms, max_depth=None, stats=None):
+		# iterative_deepening() with every depth searched by best_move()
+		deadline = time.perf_counter() + budget_ms / 1000
+		empty_cells = ROWS*COLUMNS - bb.moves
+		if max_depth is None or max_depth > empty_cells:
+			max_depth = empty_cells
+		bb = bitboard_copy(bb)
+		if bb.evaluator is None:
+			bitboard_attach_evaluator(bb)
+		column, score, completed = None, None, 0
+		for depth in range(1, max_depth+1):
+			try:
+				column, score = self.best_move(bb, depth, deadline if depth > 1 else None, column, stats)
+			except SearchTimeout:
+				break
+			completed = depth
+			if abs(score) >= 10000000000000 or time.perf_counter() >= deadline:
+				break
+		return column, score, completed
+
+def solve(bb, table=None, stats=None, ordering=None):
+	# Exact result of the position for the AI, searching to the end of the game.
+	# Only wins, losses and draws score, so the narrow (-1, 1) window is enough
+	# to tell them apart. Returns (column, score) like bitboard_minimax().
+	return bitboard_minimax(bitboard_copy(bb), ROWS*COLUMNS - bb.moves, -1, 1, True, table, None, stats,
+		ordering if ordering is not None else MoveOrdering())
+
+# Position keys: per column, the PLAYER_PIECE bits plus a marker bit above the
+# top piece, which is unique for every position. Mirroring reverses the order
+# of the columns; the canonical key is the smaller of the two.
+BB_BOTTOM_MASK = sum(1 << (c*BB_HEIGHT) for c in range(COLUMNS))
+BB_COLUMN_MASK = (1 << BB_HEIGHT) - 1
+
+def position_key(bb):
+	return bb.pieces[PLAYER_PIECE] + (bb.pieces[PLAYER_PIECE] | bb.pieces[AI_PIECE]) + BB_BOTTOM_MASK
+
+def mirror_key(key):
+	mirrored = 0
+	for c in range(COLUMNS):
+		mirrored |= (key >> (c*BB_HEIGHT) & BB_COLUMN_MASK) << ((COLUMNS-1-c)*BB_HEIGHT)
+	return mirrored
+
+def canonical_key(bb):
+	# Returns (key, mirrored), mirrored being True if the key is of the mirror image
+	key = position_key(bb)
+	mirrored = mirror_key(key)
+	if mirrored < key:
+		return mirrored, True
+	return key, False
+
+# Opening book file: a header, then fixed-size records sorted by canonical key,
+# each holding the best column and score for the AI to move in that position
+BOOK_MAGIC = b"C4BK"
+BOOK_HEADER = struct.Struct("<4sHHI") # magic, ply, search depth, record count
+BOOK_RECORD = struct.Struct("<QqB") # canonical key, score, column
+
+def write_opening_book(path, entries, ply, depth):
+	# entries maps canonical keys to (column, score) for the canonical position
+	with open(path, "wb") as f:
+		f.write(BOOK_HEADER.pack(BOOK_MAGIC, ply, depth, len(entries)))
+		for key in sorted(entries):
+			col, score = entries[key]
+			f.write(BOOK_RECORD.pack(key, score, col))
+
+class OpeningBook:
+	"""Read-only, memory-mapped opening book written by write_opening_book().
+
+	lookup() binary searches the records in place, so loading a book costs
+	nothing beyond mapping the file.
+	"""
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self.ply, self.depth, self.count = BOOK_HEADER.unpack_from(self.data, 0)
+		if magic != BOOK_MAGIC:
+			raise ValueError("%s is not a connect4 opening book" % path)
+
+	def close(self):
+		self.data.close()
+
+	def lookup(self, bb):
+		# (column, score) for the AI to move in bb, or None if it is not in the book
+		if bb.moves > self.ply:
+			return None
+		key, mirrored = canonical_key(bb)
+		low, high = 0, self.count
+		while low < high:
+			mid = (low + high) // 2
+			record_key, score, col = BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + mid*BOOK_RECORD.size)
+			if record_key < key:
+				low = mid + 1
+			elif record_key > key:
+				high = mid
+			else:
+				return (COLUMNS-1-col if mirrored else col), score
+		return None
+
+def bitboard_swap_pieces(bb):
+	# The same position with PLAYER_PIECE and AI_PIECE exchanged, so that the
+	# AI search can pick moves for PLAYER_PIECE
+	swapped = create_bitboard()
+	for c in range(COLUMNS):
+		for bit in range(c*BB_HEIGHT, bb.heights[c]):
+			piece = PLAYER_PIECE if bb.pieces[AI_PIECE] >> bit & 1 else AI_PIECE
+			bitboard_drop_piece(swapped, c, piece)
+	return swapped
+
+class Engine:
+	"""Connect 4 AI that runs without a display.
+
+	One transposition table is kept across the moves of a game (call
+	new_game() between games). Moves come from the opening book when the
+	position is in it, from solve() once at most endgame_cells cells are empty,
+	and from iterative deepening otherwise. With workers > 1 that search runs on
+	a ParallelSearch process pool; call close() when done with the engine.
+	"""
+
+	def __init__(self, workers=1, table_bytes=16*1024*1024, book=None, endgame_cells=ENDGAME_CELLS, ordering=None):
+		self.table = TranspositionTable(table_bytes)
+		self.ordering = ordering if ordering is not None else MoveOrdering()
+		self.parallel = ParallelSearch(workers, table_bytes) if workers > 1 else None
+		self.book = OpeningBook(book) if isinstance(book, str) else book
+		self.endgame_cells = endgame_cells
+		self.last_score = None
+		self.last_depth = 0
+		self.last_source = None # "book", "solver" or "search"
+		self.last_stats = SearchStats()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		if self.parallel is not None:
+			self.parallel.close()
+			self.parallel = None
+		if self.book is not None:
+			self.book.close()
+			self.book = None
+
+	def new_game(self):
+		self.table.clear()
+		self.ordering.clear()
+
+	def best_move(self, position, budget_ms=1000, piece=AI_PIECE, max_depth=None):
+		# position is a BitBoard or a create_board() array; returns the column
+		# to play for `piece`, searching for at most budget_ms milliseconds
+		if not isinstance(position, BitBoard):
+			position = bitboard_from_board(position)
+		if piece != AI_PIECE:
+			position = bitboard_swap_pieces(position)
+		stats = SearchStats()
+		empty_cells = ROWS*COLUMNS - position.moves
+		entry = self.book.lookup(position) if self.book is not None else None
+		if entry is not None:
+			col, score = entry
+			depth, source = self.book.depth, "book"
+		elif empty_cells <= self.endgame_cells:
+			self.table.new_search()
+			col, score = solve(position, self.table, stats, self.ordering)
+			depth, source = empty_cells, "solver"
+		elif self.parallel is not None:
+			col, score, depth = self.parallel.iterative_deepening(position, budget_ms, max_depth, stats)
+			source = "search"
+		else:
+			col, score, depth = iterative_deepening(position, budget_ms, self.table, max_depth, stats, self.ordering)
+			source = "search"
+		self.last_score = score
+		self.last_depth = depth
+		self.last_source = source
+		self.last_stats = stats
+		return col
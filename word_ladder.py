@@ -19,18 +19,57 @@ print('Loaded %d words' % len(WORDS))
 
 """# Build a graph of neighboring words"""
 
+from array import array
+
+# Index the dictionary by wildcard patterns: 'green' is filed under '_reen',
+# 'g_een', 'gr_en', 'gre_n' and 'gree_', so the words one letter away from a
+# word are the other words filed under its own patterns. Words are interned
+# as ids into a sorted list, and the buckets are slices of one flat array of
+# ids (bucket b is ids[starts[b]:starts[b+1]]) instead of a list per pattern.
+class WordIndex:
+    "Wildcard-pattern buckets over a set of words, built once per dictionary."
+
+    def __init__(self, words):
+        self.words = sorted(words)
+        self.patterns = {}  # pattern -> bucket number
+        members = []  # (bucket, word id), word ids ascending within a bucket
+        for word_id, word in enumerate(self.words):
+            for i in range(len(word)):
+                # neighbors only ever differ by a letter a-z
+                if 'a' <= word[i] <= 'z':
+                    pattern = word[:i] + '_' + word[i+1:]
+                    bucket = self.patterns.setdefault(pattern, len(self.patterns))
+                    members.append((bucket, word_id))
+        counts = array('I', [0]) * (len(self.patterns) + 1)
+        for bucket, _ in members:
+            counts[bucket + 1] += 1
+        for b in range(len(self.patterns)):
+            counts[b + 1] += counts[b]
+        self.starts = array('I', counts)
+        self.ids = array('I', [0]) * len(members)
+        for bucket, word_id in members:
+            self.ids[counts[bucket]] = word_id
+            counts[bucket] += 1
+
+    def neighbors(self, word):
+        "All words that are one letter away from this word."
+        neighbors = []
+        for i in range(len(word)):
+            bucket = self.patterns.get(word[:i] + '_' + word[i+1:])
+            if bucket is not None:
+                for word_id in self.ids[self.starts[bucket]:self.starts[bucket + 1]]:
+                    if self.words[word_id] != word:
+                        neighbors.append(self.words[word_id])
+        return neighbors
+
+WORD_INDEX = WordIndex(WORDS)
+
 # implement a function that returns a list of all words that are a one-letter change away from a given word
-def get_neighboring_words(word):
+def get_neighboring_words(word, index=None):
     "All words that are one letter away from this word."
-    # for each letter position in word and for each letter in the alphabet,
-    # attempt to create a new word by replacing one letter
-    # add the new word to the list of neighbors if it exists in the list of valid words
-    neighbors = [word[:i] + c + word[i+1:]
-                 for i in range(len(word))
-                 for c in 'abcdefghijklmnopqrstuvwxyz'
-                 if c != word[i]]
-    neighbors = [n for n in neighbors if n in WORDS]
-    return neighbors
+    # look up the words filed under each of the word's wildcard patterns
+    # instead of trying all 25 replacement letters at every position
+    return (index or WORD_INDEX).neighbors(word)
 
 get_neighboring_words('hello')
 # should return ['cello', 'hallo', 'hillo', 'hollo', 'hullo', 'helio', 'hells']